@@ -61,16 +61,24 @@ License: GNU GPL v3
 
 import sys
 import os
-import copy
+import math
+import warnings
 from lxml import etree
+import numpy as np
 import poly_point_isect
 from poly_point_isect import isect_segments
+try:
+    import fast_isect #optional numba accelerated intersection finder
+except ImportError:
+    fast_isect = None
 import inkex
-from inkex import transforms, bezier, PathElement, Color, Circle
+from inkex import transforms, PathElement, Color
 from inkex.bezier import csplength
 from inkex.paths import Path, CubicSuperPath
 from shapely.geometry import LineString, Point, MultiPoint
 from shapely.ops import snap, split
+from shapely.strtree import STRtree
+from shapely import __version__ as shapelyVersion
 from shapely import speedups
 if speedups.available:
     speedups.enable()
@@ -80,9 +88,92 @@ idPrefixTrimming = "trimmed"
 intersectedVerb = "intersected"
 collinearVerb = "collinear"
 
+def command_mask(letters):
+    ''' bit mask with one bit per svg path command letter (A-Z -> bit 0-25, a-z -> bit 32-57) '''
+    mask = 0
+    for letter in letters:
+        mask |= 1 << (ord(letter) - 65)
+    return mask
+
+relativeCommandsMask = command_mask('mlhvcsqtaz')
+absoluteCommandsMask = command_mask('MLHVCSQTAZ')
+bezierCommandsMask = command_mask('aAcCqQtTsS')
+lineCommandsMask = command_mask('lL')
+identityMatrix = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0)) #exact compare. Transform's == has a tolerance
+shapely2 = int(shapelyVersion.split('.')[0]) >= 2 #STRtree queries return indices instead of geometries since 2.0
+
+def approx_parabola_integral(x):
+    ''' approximation of the integral of the parabola's curvature (see Raph Levien's blog: Flattening quadratic Béziers) '''
+    d = 0.67
+    return x / (1 - d + (d ** 4 + 0.25 * x * x) ** 0.25)
+
+def approx_parabola_inv_integral(x):
+    ''' approximation of the inverse of approx_parabola_integral() '''
+    b = 0.39
+    return x * (1 - b + (b * b + 0.25 * x * x) ** 0.5)
+
 class ContourScannerAndTrimmer(inkex.EffectExtension):
 
 
+    def _path_arrays(self, element):
+        '''
+        returns element.path.to_arrays() but parses each path only once. The cache is keyed by
+        the 'd' string itself, so modified paths get parsed again. Do not modify the returned lists!
+        '''
+        d = element.get('d')
+        arrays = self._pathArraysCache.get(d)
+        if arrays is None:
+            arrays = self._pathArraysCache[d] = element.path.to_arrays()
+        return arrays
+
+
+    def _line_points(self, element, transform):
+        ''' returns x1, y1, x2, y2 of a straight line element (M + L command) with applied transform '''
+        arrays = self._path_arrays(element)
+        p1 = transform.apply_to_point(arrays[0][1][-2:])
+        p2 = transform.apply_to_point(arrays[-1][1][-2:])
+        return p1.x, p1.y, p2.x, p2.y
+
+
+    def _ctm(self, element):
+        '''
+        cached element.composed_transform(). The transform is built from the cached transform of the parent, so each
+        ancestor is only visited once. Only use it for elements which do not get new transforms while running
+        '''
+        ctm = self._ctmCache.get(element)
+        if ctm is None:
+            parent = element.getparent()
+            if isinstance(parent, inkex.BaseElement):
+                ctm = self._ctm(parent) @ element.transform
+            else:
+                ctm = element.transform
+            self._ctmCache[element] = ctm
+        return ctm
+
+
+    def is_pointy(self, subPath):
+        '''
+        checks if the second command of a sub path (given as arrays) does not leave the start point, like M "31.4794 57.6024 Z".
+        Only looks at the first two commands, so we do not need to build a CubicSuperPath of the whole sub path
+        '''
+        start = subPath[0][1][-2:]
+        cmd, args = subPath[1]
+        letter = cmd.upper()
+        if letter == 'Z':
+            return True
+        absolute = cmd == letter
+        if letter == 'H':
+            coords = [args[0], start[1] if absolute else 0]
+        elif letter == 'V':
+            coords = [start[0] if absolute else 0, args[0]]
+        elif letter == 'A':
+            coords = args[-2:] #radii, rotation and flags do not matter
+        else:
+            coords = args #end point and control points
+        ref = start if absolute else [0, 0]
+        return all(coords[i] == ref[i % 2] for i in range(len(coords)))
+
+
     def break_contours(self, element, breakelements = None):
         ''' 
         this does the same as "CTRL + SHIFT + K"
@@ -90,38 +181,33 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
          '''
         if breakelements == None:
             breakelements = []
-        if element.tag == inkex.addNS('path','svg'):
-            parent = element.getparent()
-            idx = parent.index(element)
+        #take a snapshot of all paths first because breaking apart modifies the tree
+        for pathElement in list(element.iter(inkex.addNS('path','svg'))):
+            parent = pathElement.getparent()
+            idx = parent.index(pathElement)
             idSuffix = 0
-            #raw = str(element.path).split()
-            raw = element.path.to_arrays() 
-            subPaths = []
-            prev = 0
-            for i in range(len(raw)): # Breaks compound paths into simple paths
-                #if raw[i][0].upper() == 'M' and i != 0:
-                if raw[i][0] == 'M' and i != 0:
-                    subPath = raw[prev:i]
-                    subPaths.append(Path(subPath))
-                    prev = i
-            subPaths.append(Path(raw[prev:])) #finally add the last path
-
-            for subPath in subPaths:
-                replacedelement = copy.copy(element)
-                oldId = replacedelement.get('id')
-                csp = CubicSuperPath(subPath)
-                if len(subPath) > 1 and csp[0][0] != csp[0][1]: #avoids pointy paths like M "31.4794 57.6024 Z"
-                    replacedelement.path = subPath
-                    if len(subPaths) == 1:
+            #raw = str(pathElement.path).split()
+            raw = self._path_arrays(pathElement)
+            oldId = pathElement.get('id')
+            # Breaks compound paths into simple paths. We only collect the (start, end) indices of the sub paths in one pass
+            starts = [i for i in range(1, len(raw)) if raw[i][0] == 'M']
+            subPathBounds = list(zip([0] + starts, starts + [len(raw)]))
+
+            for start, end in subPathBounds:
+                subPath = raw[start:end]
+                if len(subPath) < 2:
+                    continue
+                if not self.is_pointy(subPath): #avoids pointy paths like M "31.4794 57.6024 Z"
+                    replacedelement = pathElement.makeelement(pathElement.tag, pathElement.attrib) #copies the attributes only. Much cheaper than copying the whole element
+                    replacedelement.path = Path(subPath)
+                    if len(subPathBounds) == 1:
                         replacedelement.set('id', oldId)
                     else:
                         replacedelement.set('id', oldId + str(idSuffix))
                         idSuffix += 1
                     parent.insert(idx, replacedelement)
                     breakelements.append(replacedelement)
-            element.delete()
-        for child in element.getchildren():
-            self.break_contours(child, breakelements)
+            pathElement.delete()
         return breakelements
 
 
@@ -129,10 +215,7 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         ''' a function to get child paths from elements (used by "handling groups" option) '''
         if elements == None:
             elements = []
-        if element.tag == inkex.addNS('path','svg'):
-                elements.append(element)
-        for child in element.getchildren():
-            self.get_child_paths(child, elements)
+        elements.extend(element.iter(inkex.addNS('path','svg')))
         return elements
 
 
@@ -140,7 +223,7 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         ''' get all path elements, either from selection or from whole document. Uses options '''
         pathElements = []
         if len(self.svg.selected) == 0: #if nothing selected we search for the complete document
-            pathElements = self.document.xpath('//svg:path', namespaces=inkex.NSS)
+            pathElements = list(self.svg.iter(inkex.addNS('path','svg')))
         else: # or get selected paths (and children) and convert them to shapely LineString objects
             if self.options.handle_groups is False:
                 pathElements = list(self.svg.selection.filter(PathElement).values())
@@ -166,66 +249,223 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
 
     def find_group(self, groupId):
         ''' check if a group with a given id exists or not. Returns None if not found, else returns the group element '''
-        groups = self.document.xpath('//svg:g', namespaces=inkex.NSS)
-        for group in groups:
-            #self.msg(str(layer.get('inkscape:label')) + " == " + layerName)
-            if group.get('id') == groupId:
-                return group
-        return None
-
-
-    def adjust_style(self, element):
-        ''' Replace some style attributes of the given element '''
-        if element.attrib.has_key('style'):
-            style = element.get('style')
-            if style:
-                declarations = style.split(';')
-                for i,decl in enumerate(declarations):
-                    parts = decl.split(':', 2)
-                    if len(parts) == 2:
-                        (prop, val) = parts
-                        prop = prop.strip().lower()
-                        if prop == 'stroke-width':
-                            declarations[i] = prop + ':' + str(self.svg.unittouu(str(self.options.strokewidth) +"px"))
-                        if prop == 'fill':
-                            declarations[i] = prop + ':none'
-                element.set('style', ';'.join(declarations) + ';stroke:#000000;stroke-opacity:1.0')
-        else:
-            element.set('style', 'stroke:#000000;stroke-opacity:1.0')
-
-
-    def line_from_segments(self, segs, i, decimals):
-        '''builds a straight line for the segment i and the next segment i+2. Returns both point XY coordinates'''
-        pseudoPath = Path(segs[i:i+2]).to_arrays()
-        x1 = round(pseudoPath[0][1][-2], decimals)
-        y1 = round(pseudoPath[0][1][-1], decimals)
-        if pseudoPath[1][0] == 'Z': #some crappy code when the path is closed
-            pseudoPathEnd = Path(segs[0:2]).to_arrays()
-            x2 = round(pseudoPathEnd[0][1][-2], decimals)
-            y2 = round(pseudoPathEnd[0][1][-1], decimals)
+        if self._groupIndex is None: #build the id index only once
+            self._groupIndex = {}
+            for group in self.svg.iter(inkex.addNS('g','svg')):
+                self._groupIndex.setdefault(group.get('id'), group)
+        group = self._groupIndex.get(groupId)
+        if group is None: #the group might have been added by someone else after building the index
+            for g in self.svg.iter(inkex.addNS('g','svg')):
+                self._groupIndex.setdefault(g.get('id'), g)
+            group = self._groupIndex.get(groupId)
+        if group is not None and group.getparent() is None: #the group was deleted in the meantime
+            del self._groupIndex[groupId]
+            return None
+        return group
+
+
+    def add_group(self, parent, groupId):
+        ''' add a new group with the given id to parent and register it at the group index of find_group() '''
+        group = parent.add(inkex.Group(id=groupId))
+        if self._groupIndex is not None:
+            self._groupIndex[group.get('id')] = group
+        return group
+
+
+    def adjust_style(self, element, strokeWidth):
+        ''' Replace some style attributes of the given element. strokeWidth is the already converted stroke width in user units '''
+        style = inkex.Style(element.get('style', ''))
+        if 'stroke-width' in style:
+            style['stroke-width'] = str(strokeWidth)
+        if 'fill' in style:
+            style['fill'] = 'none'
+        style['stroke'] = '#000000'
+        style['stroke-opacity'] = '1.0'
+        element.set('style', str(style))
+
+
+    def lines_from_segments(self, segs, decimals):
+        '''
+        builds straight lines for each segment i and the next segment i+1 at once.
+        segs are the absolute segments of CubicSuperPath.to_segments() (Move and Curve commands), so we can read
+        the end points from their arguments without building a Path. Returns an array of shape (n-1, 2, 2) containing
+        both point XY coordinates of each line
+        '''
+        pts = np.array([seg.args[-2:] if seg.letter != 'Z' else (np.nan, np.nan) for seg in segs], dtype=np.float64).reshape(-1, 2)
+        pts[np.isnan(pts[:, 0])] = pts[0] #some crappy code when the path is closed
+        pts = np.round(pts, decimals)
+        return np.stack([pts[:-1], pts[1:]], axis=1)
+
+
+    def flatten_cubics(self, cubics, tolerance):
+        '''
+        flatten an array of cubic beziers (shape (K, 4, 2)) with the approach of Raph Levien (Flattening quadratic Béziers):
+        - split each cubic into as much quadratic beziers as required to stay within 10% of the tolerance
+        - flatten each quadratic in closed form. The points are distributed evenly along the curvature,
+          so we get (nearly) the minimal count of lines for the given tolerance
+        All beziers are processed at once. Returns the points (without the start points of the cubics) as array of
+        shape (N, 2) and the count of points for each cubic
+        '''
+        p0, p1, p2, p3 = cubics[:, 0], cubics[:, 1], cubics[:, 2], cubics[:, 3]
+
+        #error of the quadratic approximation is sqrt(3)/36 * |p3 - 3p2 + 3p1 - p0| / n^3
+        err = np.hypot(*(p3 - 3 * p2 + 3 * p1 - p0).T)
+        quadCount = np.maximum(1, np.ceil((err / (math.sqrt(432) * 0.1 * tolerance)) ** (1 / 3))).astype(np.int64)
+        cubicIndex = np.repeat(np.arange(len(cubics)), quadCount)
+        n = quadCount[cubicIndex]
+        i = np.arange(len(cubicIndex)) - np.repeat(np.cumsum(quadCount) - quadCount, quadCount)
+        t0 = (i / n)[:, None]
+        t1 = ((i + 1) / n)[:, None]
+        c0, c1, c2, c3 = p0[cubicIndex], p1[cubicIndex], p2[cubicIndex], p3[cubicIndex]
+        def point_at(t):
+            mt = 1 - t
+            return mt ** 3 * c0 + 3 * mt * mt * t * c1 + 3 * mt * t * t * c2 + t ** 3 * c3
+        def derivative_at(t):
+            mt = 1 - t
+            return 3 * (mt * mt * (c1 - c0) + 2 * mt * t * (c2 - c1) + t * t * (c3 - c2))
+        #control points of the sub cubics from t0 to t1, then the quadratic control point (3 * (c1 + c2) - (start + end)) / 4
+        qStart = point_at(t0)
+        qEnd = point_at(t1)
+        h = (t1 - t0) / 3
+        qControl = (3 * ((qStart + derivative_at(t0) * h) + (qEnd - derivative_at(t1) * h)) - qStart - qEnd) / 4
+
+        #flatten the quadratic beziers
+        quadTolerance = (1 - 0.1) * tolerance
+        dd = 2 * qControl - qStart - qEnd
+        cross = (qEnd[:, 0] - qStart[:, 0]) * dd[:, 1] - (qEnd[:, 1] - qStart[:, 1]) * dd[:, 0]
+        straight = np.abs(cross) < 1e-12
+        with np.errstate(divide='ignore', invalid='ignore'):
+            safeCross = np.where(straight, 1.0, cross)
+            x0 = np.sum((qControl - qStart) * dd, axis=1) / safeCross
+            x2 = np.sum((qEnd - qControl) * dd, axis=1) / safeCross
+            scale = np.abs(safeCross) / (np.hypot(dd[:, 0], dd[:, 1]) * np.abs(x2 - x0))
+            a0 = approx_parabola_integral(x0)
+            a2 = approx_parabola_integral(x2)
+            count = np.where((x0 < 0) == (x2 < 0),
+                0.5 * np.abs(a2 - a0) * np.sqrt(scale / quadTolerance),
+                0.5 * np.abs(a2 - a0) / approx_parabola_integral(np.sqrt(quadTolerance / scale))) #cusp case (the curvature maximum is inside of the segment)
+        count[straight | ~np.isfinite(count)] = 1
+        lineCount = np.maximum(1, np.ceil(count)).astype(np.int64)
+
+        quadIndex = np.repeat(np.arange(len(lineCount)), lineCount)
+        m = lineCount[quadIndex]
+        j = np.arange(len(quadIndex)) - np.repeat(np.cumsum(lineCount) - lineCount, lineCount) + 1
+        qa0, qa2 = a0[quadIndex], a2[quadIndex]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u0 = approx_parabola_inv_integral(qa0)
+            u2 = approx_parabola_inv_integral(qa2)
+            t = (approx_parabola_inv_integral(qa0 + (qa2 - qa0) * j / m) - u0) / (u2 - u0)
+        t = np.where(j == m, 1.0, t)[:, None] #the last point is the end point of the quadratic bezier
+        mt = 1 - t
+        points = mt * mt * qStart[quadIndex] + 2 * mt * t * qControl[quadIndex] + t * t * qEnd[quadIndex]
+        pointCounts = np.bincount(cubicIndex, weights=lineCount, minlength=len(cubics)).astype(np.int64)
+        return points, pointCounts
+
+
+    def flatten_subpaths(self, subPathDatas, tolerance):
+        '''
+        flatten all cubic super paths of a path at once (see flatten_cubics). Returns a list of path arrays (M + L commands)
+        with the same order like subPathDatas
+        '''
+        cubics = []
+        for subPathData in subPathDatas:
+            for sp in subPathData:
+                nodes = np.asarray(sp, dtype=np.float64)
+                cubics.append(np.stack([nodes[:-1, 1], nodes[:-1, 2], nodes[1:, 0], nodes[1:, 1]], axis=1))
+        if len(cubics) > 0:
+            points, pointCounts = self.flatten_cubics(np.concatenate(cubics), tolerance)
+        pointsSplit = np.cumsum(pointCounts) if len(cubics) > 0 else []
+        flattenedPaths = []
+        cubicIndex = 0
+        for subPathData in subPathDatas:
+            flattenedPath = []
+            for sp in subPathData:
+                flattenedPath.append(['M', [sp[0][1][0], sp[0][1][1]]])
+                if len(sp) > 1:
+                    first = pointsSplit[cubicIndex - 1] if cubicIndex > 0 else 0
+                    last = pointsSplit[cubicIndex + len(sp) - 2]
+                    flattenedPath.extend(['L', point] for point in points[first:last].tolist())
+                    cubicIndex += len(sp) - 1
+            flattenedPaths.append(flattenedPath)
+        return flattenedPaths
+
+
+    def find_intersections(self, segments):
+        ''' find all intersection points of the given segments [((x1, y1), (x2, y2)), ...] with the selected intersection finder '''
+        if self.options.intersection_finder == "numba" and fast_isect is not None:
+            return fast_isect.isect_segments(segments, ignore_segment_endings=self.options.bent_ott_use_ignore_segment_endings)
+        elif self.options.intersection_finder == "bentley_ottmann":
+            return isect_segments(segments, validate=True)
+        return self.shapely_intersections(segments)
+
+
+    def shapely_intersections(self, segments):
+        '''
+        find all intersection points of the given segments using a STRtree spatial index and GEOS intersection tests.
+        Overlapping collinear segments do not intersect (same as Bentley-Ottmann). Returns a list of (x, y) tuples without duplicates
+        '''
+        lines = [LineString(segment) for segment in segments]
+        if shapely2 is True:
+            tree = STRtree(lines)
+            query = tree.query #returns the indices of the candidates
         else:
-            x2 = round(pseudoPath[1][1][-2], decimals)
-            y2 = round(pseudoPath[1][1][-1], decimals)
-        return x1, y1, x2, y2
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore") #ShapelyDeprecationWarning about the changed STRtree in shapely 2.0
+                tree = STRtree(lines)
+            query = tree.query_items #the items default to the indices of the geometries
+        ignoreEndings = self.options.bent_ott_use_ignore_segment_endings
+        points = {}
+        for i, line in enumerate(lines):
+            for j in query(line):
+                j = int(j)
+                if j <= i: #test each pair only once and skip the line itself
+                    continue
+                candidate = lines[j]
+                if not line.intersects(candidate):
+                    continue
+                intersection = line.intersection(candidate)
+                if intersection.geom_type != 'Point': #collinear overlaps
+                    continue
+                point = (intersection.x, intersection.y)
+                if ignoreEndings is True and point in segments[i] and point in segments[j]:
+                    continue #both segments only touch each other with their end points
+                points[point] = None
+        return list(points)
+
+
+    def merge_close_points(self, points, tolerance):
+        '''
+        merge points which fall into the same grid cell of size tolerance. Keeps the first point of each cell in the original order.
+        Returns a numpy array of shape (N, 2)
+        '''
+        pointsArray = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(pointsArray) == 0 or tolerance <= 0:
+            return pointsArray
+        keys = np.round(pointsArray / tolerance).astype(np.int64)
+        ignore, idx = np.unique(keys, axis=0, return_index=True)
+        return pointsArray[np.sort(idx)]
+
+
+    def circles_path_data(self, points):
+        '''
+        build the path data for circles at the given (x, y) point coordinates.
+        All circles go into one single path instead of one circle element per point (much faster for a lot of points)
+        '''
+        r = self._dotRadius
+        circle = ' m {},0 a {},{} 0 1,0 {},0 a {},{} 0 1,0 {},0 z'.format(-r, r, r, 2 * r, r, r, -2 * r)
+        return ' '.join('M {},{}{}'.format(cx, cy, circle) for cx, cy in points)
 
 
     def visualize_self_intersections(self, pathElement, selfIntersectionPoints):
         ''' Draw some circles at given point coordinates (data from array)'''
         selfIntersectionGroup = pathElement.getparent().add(inkex.Group(id="selfIntersectionPoints-{}".format(pathElement.attrib["id"])))
         selfIntersectionPointStyle = {'stroke': 'none', 'fill': self.options.color_self_intersections}
-        for selfIntersectionPoint in selfIntersectionPoints:
-            cx = selfIntersectionPoint[0]
-            cy = selfIntersectionPoint[1]
-            selfIntersectionPointCircle = Circle(cx=str(cx),
-                            cy=str(cy),
-                            r=str(self.svg.unittouu(str(self.options.dotsize_intersections / 2) + "px"))
-                            )
-            
-            if pathElement.getparent() != self.svg.root:
-                selfIntersectionPointCircle.transform = -pathElement.getparent().composed_transform()
-            selfIntersectionPointCircle.set('id', self.svg.get_unique_id('selfIntersectionPoint-'))
-            selfIntersectionPointCircle.style = selfIntersectionPointStyle
-            selfIntersectionGroup.add(selfIntersectionPointCircle)
+        selfIntersectionPointCircles = inkex.PathElement(id=self.svg.get_unique_id('selfIntersectionPoint-'))
+        selfIntersectionPointCircles.attrib['d'] = self.circles_path_data((p[0], p[1]) for p in selfIntersectionPoints)
+        if pathElement.getparent() != self.svg.root:
+            selfIntersectionPointCircles.transform = -self._ctm(pathElement.getparent())
+        selfIntersectionPointCircles.style = selfIntersectionPointStyle
+        selfIntersectionGroup.add(selfIntersectionPointCircles)
         return selfIntersectionGroup
 
 
@@ -234,20 +474,14 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         if len(globalIntersectionPoints) > 0: #only create a group and add stuff if there are some elements to work on 
             globalIntersectionGroup = self.svg.root.add(inkex.Group(id="globalIntersectionPoints"))
             globalIntersectionPointStyle = {'stroke': 'none', 'fill': self.options.color_global_intersections}
-            for globalIntersectionPoint in globalIntersectionPoints:
-                cx = globalIntersectionPoint.coords[0][0]
-                cy = globalIntersectionPoint.coords[0][1]
-                globalIntersectionPointCircle = Circle(cx=str(cx),
-                    cy=str(cy),
-                    r=str(self.svg.unittouu(str(self.options.dotsize_intersections / 2) + "px"))
-                    )
-                globalIntersectionPointCircle.set('id', self.svg.get_unique_id('globalIntersectionPoint-'))
-                globalIntersectionPointCircle.style = globalIntersectionPointStyle
-                globalIntersectionGroup.add(globalIntersectionPointCircle)
-
-
-    def build_trim_line_group(self, subSplitLineArray, subSplitIndex, globalIntersectionPoints): 
-        ''' make a group containing trimmed lines'''      
+            globalIntersectionPointCircles = inkex.PathElement(id=self.svg.get_unique_id('globalIntersectionPoint-'))
+            globalIntersectionPointCircles.attrib['d'] = self.circles_path_data(globalIntersectionPoints.tolist())
+            globalIntersectionPointCircles.style = globalIntersectionPointStyle
+            globalIntersectionGroup.add(globalIntersectionPointCircles)
+
+
+    def build_trim_line_group(self, subSplitLineArray, subSplitIndex, ls, globalIntersectionPoints): 
+        ''' make a group containing trimmed lines. ls is the (transformed) LineString of the sub split line'''      
         
         #Check if we should skip or process the path anyway   
         isClosed = subSplitLineArray[subSplitIndex].attrib['originalPathIsClosed']
@@ -255,21 +489,28 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         elif self.options.trimming_path_types == 'closed_paths' and isClosed == 'False': return #skip this call
         elif self.options.trimming_path_types == 'both': pass
      
-        csp = Path(subSplitLineArray[subSplitIndex].path.transform(subSplitLineArray[subSplitIndex].composed_transform())).to_arrays() #will be buggy if draw subsplit lines is deactivated
+        #only snap and split against the intersection points which are close to the line. The points are sorted by x,
+        #so a binary search gives the candidates within the x range of the line
+        tol = self.options.snap_tolerance
+        (x0, y0), (x1, y1) = ls.coords[:2]
+        start = np.searchsorted(globalIntersectionPoints[:, 0], min(x0, x1) - tol, side='left')
+        end = np.searchsorted(globalIntersectionPoints[:, 0], max(x0, x1) + tol, side='right')
+        candidates = globalIntersectionPoints[start:end]
+        candidates = candidates[(candidates[:, 1] >= min(y0, y1) - tol) & (candidates[:, 1] <= max(y0, y1) + tol)]
+        #the bounding box of diagonal lines is large. Drop the candidates which are too far away from the line to be snapped
+        dx, dy = x1 - x0, y1 - y0
+        lengthSq = dx * dx + dy * dy
+        t = np.clip(((candidates[:, 0] - x0) * dx + (candidates[:, 1] - y0) * dy) / lengthSq, 0.0, 1.0) if lengthSq > 0 else 0.0
+        nearbyIntersectionPoints = candidates[np.hypot(candidates[:, 0] - (x0 + t * dx), candidates[:, 1] - (y0 + t * dy)) <= tol]
 
-        ls = LineString([(csp[0][1][0], csp[0][1][1]), (csp[1][1][0], csp[1][1][1])])
-        
-        trimLineStyle = {'stroke': str(self.options.color_trimmed), 'fill': 'none', 'stroke-width': self.options.strokewidth}
-           
-        linesWithSnappedIntersectionPoints = snap(ls, globalIntersectionPoints, self.options.snap_tolerance)
         trimGroupParentId = subSplitLineArray[subSplitIndex].attrib['originalPathId']
         trimGroupId = '{}-{}-{}'.format(idPrefixTrimming, idPrefixSubSplit, trimGroupParentId)
         trimGroupParent = self.svg.getElementById(trimGroupParentId)
         trimGroup = self.find_group(trimGroupId)
 
         if trimGroup is None:
-            trimGroup = trimGroupParent.getparent().add(inkex.Group(id=trimGroupId))
-            trimGroup.transform = -subSplitLineArray[subSplitIndex].composed_transform()
+            trimGroup = self.add_group(trimGroupParent.getparent(), trimGroupId)
+            trimGroup.transform = -self._ctm(subSplitLineArray[subSplitIndex])
           
         #apply isBezier and original path id information to group (required for bezier splitting the original path at the end)
         trimGroup.attrib['originalPathIsBezier'] = subSplitLineArray[subSplitIndex].attrib['originalPathIsBezier']
@@ -277,10 +518,17 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         trimGroup.attrib['originalPathId'] = subSplitLineArray[subSplitIndex].attrib['originalPathId']
 
         #split all lines against all other lines using the intersection points
-        trimLines = split(linesWithSnappedIntersectionPoints, globalIntersectionPoints)
-
+        if len(nearbyIntersectionPoints) > 0:
+            nearbyIntersectionPoints = MultiPoint(nearbyIntersectionPoints)
+            linesWithSnappedIntersectionPoints = snap(ls, nearbyIntersectionPoints, tol)
+            trimLines = split(linesWithSnappedIntersectionPoints, nearbyIntersectionPoints)
+        else: #no intersection point nearby. So we cannot split anything and skip snapping (shapely does not split by empty collections)
+            trimLines = [ls]
+
+        decimals = self.options.decimals
         splitAt = [] #if the sub split line was split by an intersecting line we receive two trim lines with same assigned original path id!
         prevLine = None
+        trimLineElements = [] #added to the trim group in one go
         for j in range(len(trimLines)):
 
             trimLineId = "{}-{}".format(trimGroupId, subSplitIndex)
@@ -295,26 +543,27 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                 prevLine.attrib['id'] = "{}-{}".format(trimGroupId, str(subSplitIndex) + "-" + self.svg.get_unique_id(intersectedVerb + "-"))
                 prevLine.attrib['intersected'] = 'True' #some dirty flag we need
             prevLine = trimLine = inkex.PathElement(id=trimLineId)
-            x, y = trimLines[j].coords.xy          
-            x0 = round(x[0], self.options.decimals)
-            x1 = round(x[1], self.options.decimals)
-            y0 = round(y[0], self.options.decimals)
-            y1 = round(y[1], self.options.decimals)
+            (x0, y0), (x1, y1) = trimLines[j].coords[:2] #a trim line always has exactly two vertices
+            x0 = round(x0, decimals)
+            x1 = round(x1, decimals)
+            y0 = round(y0, decimals)
+            y1 = round(y1, decimals)
             if x0 == x1 and y0 == y1: #check if the trimLine is a pointy one (rounded start point equals rounded end point)
                 if self.options.show_debug is True:
                     self.msg("pointy trim line (start point equals end point). Skipping ...")
                 continue
             
-            trimLine.attrib['d'] = 'M {},{} L {},{}'.format(x0, y0, x1, y1) #we set the path of trimLine using 'd' attribute because if we use trimLine.path the decimals get cut off unwantedly
-            #trimLine.path = Path([['M', [x0,y0]], ['L', [x1,y1]]])
-
-            #if trimGroupParentTransform is not None:
-            #    trimLine.path = trimLine.path.transform(-trimGroupParentTransform)
+            #we set the path of trimLine using 'd' attribute because if we use trimLine.path the decimals get cut off unwantedly.
+            #No transform required here: the trim group itself carries the inverse transform of the original path
+            trimLine.attrib['d'] = 'M {},{} L {},{}'.format(x0, y0, x1, y1)
             if self.options.trimmed_style == "apply_from_trimmed":
-                trimLine.style = trimLineStyle
+                trimLine.set('style', self._trimLineStyle) #already serialized, no need to parse the style again for each line
             elif self.options.trimmed_style == "apply_from_original":
-                trimLine.style = subSplitLineArray[subSplitIndex].attrib['originalPathStyle']
-            trimGroup.add(trimLine)
+                trimLine.set('style', subSplitLineArray[subSplitIndex].attrib['originalPathStyle'])
+            trimLineElements.append(trimLine)
+        #remember the final ids containing intersectedVerb (a line may get renamed twice) for combine_nonintersects()
+        self._intersectedIds.update(trimLine.get('id') for trimLine in trimLineElements if intersectedVerb in trimLine.get('id'))
+        trimGroup.extend(trimLineElements)
         return trimGroup
 
 
@@ -436,14 +685,8 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
 
         # collect segments, calculate their slopes, order their points left-to-right
         for line in lineArray:
-            #csp = line.path.to_arrays()
             parent = line.getparent()
-            if parent is not None:
-                csp = Path(line.path.transform(parent.composed_transform())).to_arrays()
-            else:
-                csp = line.path.to_arrays()
-            #self.msg("csp = {}".format(csp))
-            x1, y1, x2, y2 = csp[0][1][0], csp[0][1][1], csp[1][1][0], csp[1][1][1]
+            x1, y1, x2, y2 = self._line_points(line, parent.composed_transform() if parent is not None else transforms.Transform())
             # ensure p0 is left of p1
             if x1 < x2:
                 s = {
@@ -487,7 +730,7 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         output_set_x = []
         output_x_ids = []
         
-        if len(input_set) > 0:
+        if len(input_set) > 1: #the last item is always the 'False' marker
             current_slope = input_set[0]['slope']
             for input in input_set:
                 # bin sets of input_set by slope (within a tolerance)
@@ -609,14 +852,18 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
             note: this function is similar to filter_collinear but we keep it because we have a 'reverse_trim_removal_order' option.
             We can use this option in some special situations where we work without the function 'filter_collinear()'.
         '''
-        totalTrimPaths = []
+        totalTrimPaths = set() #hashed keys of rounded start/end points. Much faster than comparing against a list of Path objects
+        decimals = self.options.decimals
         if self.options.reverse_trim_removal_order is True:
             allTrimGroups = allTrimGroups[::-1]
         for trimGroup in allTrimGroups:
             for element in trimGroup:
-                path = element.path.transform(element.composed_transform())
-                if path not in totalTrimPaths:
-                    totalTrimPaths.append(path)
+                x1, y1, x2, y2 = self._line_points(element, element.composed_transform())
+                p1 = (round(x1, decimals), round(y1, decimals))
+                p2 = (round(x2, decimals), round(y2, decimals))
+                key = tuple(sorted((p1, p2))) #sort the points to find reversed duplicates too
+                if key not in totalTrimPaths:
+                    totalTrimPaths.add(key)
                 else:
                     if self.options.show_debug is True:
                         self.msg("Deleting path {}".format(element.get('id')))
@@ -631,7 +878,7 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         ''' 
         combine and chain all non intersected sub split lines which were trimmed at intersection points before.
         - At first we sort out all lines by their id: 
-            - if the lines id contains intersectedVerb, we ignore it
+            - if the lines id contains intersectedVerb, we ignore it (those ids are collected in self._intersectedIds while trimming)
             - we combine all lines which do not contain intersectedVerb
         - Then we loop through that combined structure and chain their segments which touch each other
         Changes the style according to user setting.
@@ -643,29 +890,26 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         for trimGroup in allTrimGroups:
             totalIntersectionsAtPath = 0
             combinedPath = None
-            combinedPathData = Path()
+            segData = [] #collect the segments of all combinable paths and build the new path only once at the end
             if self.options.show_debug is True:
                 self.msg("trim group {} has {} paths".format(trimGroup.get('id'), len(trimGroup)))
             for pElement in trimGroup:
                 pId = pElement.get('id')
                 #if self.options.show_debug is True:
                 #    self.msg("trim paths id {}".format(pId))
-                if intersectedVerb not in pId:
+                if pId not in self._intersectedIds:
+                    segData.extend(self._path_arrays(pElement))
                     if combinedPath is None:
                         combinedPath = pElement
-                        combinedPathData = pElement.path
                     else:
-                        combinedPathData += pElement.path
                         pElement.delete()
                 else:
                     totalIntersectionsAtPath += 1
-            if len(combinedPathData) > 0:
-                segData = combinedPathData.to_arrays()
-                newPathData = []
-                newPathData.append(segData[0]) 
-                for z in range(1, len(segData)): #skip first because we add it statically
-                    if segData[z][1] != segData[z-1][1]:
-                       newPathData.append(segData[z])
+            if len(segData) > 0:
+                #drop each segment which has the same coordinates like its predecessor (all segments are M or L commands)
+                coords = np.array([seg[1] for seg in segData], dtype=np.float64)
+                keep = np.flatnonzero(np.any(coords[1:] != coords[:-1], axis=1)) + 1
+                newPathData = [segData[0]] + [segData[z] for z in keep] #keep first because we add it statically
                 if self.options.show_debug is True:
                     self.msg("trim group {} has {} combinable segments:".format(trimGroup.get('id'), len(newPathData)))     
                     self.msg("{}".format(newPathData))
@@ -690,15 +934,15 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                 globalTParameters = []
                 if self.options.show_debug is True:
                     self.msg("{}: count of trim lines = {}".format(trimGroup.get('id'), len(trimGroup)))
-                totalLength = 0
+                lineLengths = [] #calculate each length only once
                 for trimLine in trimGroup:
                     ignore, lineLength = csplength(CubicSuperPath(trimLine.get('d')))
-                    totalLength += lineLength
+                    lineLengths.append(lineLength)
+                totalLength = sum(lineLengths)
                 if self.options.show_debug is True:
                     self.msg("total length = {}".format(totalLength))
                 chainLength = 0
-                for trimLine in trimGroup:
-                    ignore, lineLength = csplength(CubicSuperPath(trimLine.get('d')))
+                for trimLine, lineLength in zip(trimGroup, lineLengths):
                     chainLength += lineLength
                     if trimLine.attrib.has_key('intersected') or trimLine == trimGroup[-1]: #we may not used intersectedVerb because this was used for the affected left as well as the right side of the splitting. This would result in one "intersection" too much.
                         globalTParameter = chainLength / totalLength
@@ -791,6 +1035,7 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         pars.add_argument("--bent_ott_use_paranoid", type=inkex.Boolean, default=False)
         pars.add_argument("--bent_ott_use_vertical", type=inkex.Boolean, default=True)
         pars.add_argument("--bent_ott_number_type", default="native")
+        pars.add_argument("--intersection_finder", default="shapely", help="Algorithm to find the intersections of the sub split lines")
 
         #Colors
         pars.add_argument("--color_subsplit", type=Color, default='1630897151', help="sub split lines")   
@@ -819,6 +1064,14 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
     def effect(self):
 
         so = self.options
+        self._pathArraysCache = {}
+        self._groupIndex = None
+        self._ctmCache = {}
+        self._intersectedIds = set() #ids of trim lines which got the intersectedVerb
+        self._subSplitLineEnds = {} #sub split line element -> end points in global coordinates
+        #convert the values which are used by the inner loops only once
+        self._dotRadius = self.svg.unittouu(str(so.dotsize_intersections / 2) + "px")
+        self._trimLineStyle = str(inkex.Style({'stroke': str(so.color_trimmed), 'fill': 'none', 'stroke-width': so.strokewidth}))
 
         if so.break_apart is True and so.show_debug is True:
             self.msg("Warning: 'Break apart input' setting is enabled. Cannot check accordingly for relative, absolute or mixed paths for breaked elements (they are always absolute)!")
@@ -846,6 +1099,9 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         if so.bent_ott_use_debug is True:
             so.show_debug = True
 
+        if so.intersection_finder == "numba" and fast_isect is None:
+            self.msg("Warning: numba is not installed. Falling back to Shapely intersection finder. Install numba with 'pip install numba'")
+
         #some constant stuff / styles
         relativePathStyle = {'stroke': str(so.color_relative), 'fill': 'none', 'stroke-width': so.strokewidth}
         absolutePathStyle = {'stroke': str(so.color_absolute), 'fill': 'none', 'stroke-width': so.strokewidth}
@@ -890,11 +1146,17 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         pathElements = self.get_path_elements()
           
         subSplitLineArray = []
+
+        adjustedStrokeWidth = self.svg.unittouu(str(so.strokewidth) + "px") #only convert once, the same value is used for all paths
         
         for pathElement in pathElements:
             originalPathId = pathElement.attrib["id"]
-            path = pathElement.path.transform(pathElement.composed_transform())
-            #path = pathElement.path
+            parent = pathElement.getparent()
+            ctm = self._ctm(pathElement)
+            path = pathElement.path #parse 'd' only once
+            if ctm.matrix != identityMatrix: #skip the copy of untransformed paths
+                path = path.transform(ctm)
+            pathCommands = command_mask(cmd.letter for cmd in path) #which command letters are used in the path. Not from to_arrays(), which makes all commands absolute
                 
             '''
             check for relative or absolute paths
@@ -902,10 +1164,9 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
             isRelative = False
             isAbsolute = False
             isRelAbsMixed = False
-            relCmds = ['m', 'l', 'h', 'v', 'c', 's', 'q', 't', 'a', 'z']
-            if any(relCmd in str(path) for relCmd in relCmds):
+            if pathCommands & relativeCommandsMask:
                 isRelative = True
-            if any(relCmd.upper() in str(path) for relCmd in relCmds):
+            if pathCommands & absoluteCommandsMask:
                 isAbsolute = True
             if isRelative is True and isAbsolute is True: #cannot be both at the same time, so it's mixed
                 isRelAbsMixed = True
@@ -927,10 +1188,9 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
             isPoly = False         
             isBezier = False
             isPolyBezMixed = False
-            chars = set('aAcCqQtTsS')
-            if any((c in chars) for c in str(path)):
+            if pathCommands & bezierCommandsMask:
                 isBezier = True
-            if ('l' in str(path) or 'L' in str(path)):
+            if pathCommands & lineCommandsMask:
                 isPoly = True
             if isPoly is True and isBezier is True: #cannot be both at the same time, so it's mixed
                 isPolyBezMixed = True
@@ -967,7 +1227,44 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                 continue #skip this loop iteration
   
             if so.draw_subsplit is True:
-                subSplitLineGroup = pathElement.getparent().add(inkex.Group(id="{}-{}".format(idPrefixSubSplit, originalPathId)))
+                subSplitLineGroup = parent.add(inkex.Group(id="{}-{}".format(idPrefixSubSplit, originalPathId)))
+
+            #the style and the original path information are the same for all sub split lines of this path
+            pathStyle = pathElement.style
+            subSplitLineStyle = basicSubSplitLineStyle
+            if so.subsplit_style == "apply_from_highlightings":
+                if isRelative is True and so.highlight_relative is True:
+                    subSplitLineStyle = relativePathStyle
+                if isAbsolute is True and so.highlight_absolute is True:
+                    subSplitLineStyle = absolutePathStyle
+                if isRelAbsMixed is True and so.highlight_rel_abs_mixed is True:
+                    subSplitLineStyle = mixedRelAbsPathStyle
+                if isPoly is True and so.highlight_polylines is True:
+                    subSplitLineStyle = polylinePathStyle
+                if isBezier is True and so.highlight_beziers is True:
+                    subSplitLineStyle = bezierPathStyle
+                if isPolyBezMixed is True and so.highlight_poly_bez_mixed is True:
+                    subSplitLineStyle = mixedPolyBezPathStyle
+                if isClosed is True:
+                    if so.highlight_closed is True:
+                        subSplitLineStyle = closedPathStyle
+                else:
+                    if so.highlight_opened is True:
+                        subSplitLineStyle = openPathStyle
+            elif so.subsplit_style == "apply_from_original":
+                subSplitLineStyle = pathStyle
+            subSplitLineAttribs = {
+                'style': str(inkex.Style(subSplitLineStyle)),
+                'originalPathId': originalPathId,
+                'originalPathIsRelative': str(isRelative),
+                'originalPathIsAbsolute': str(isAbsolute),
+                'originalPathIsRelAbsMixed': str(isRelAbsMixed),
+                'originalPathIsBezier': str(isBezier),
+                'originalPathIsPoly': str(isPoly),
+                'originalPathIsPolyBezMixed': str(isPolyBezMixed),
+                'originalPathIsClosed': str(isClosed),
+                'originalPathStyle': str(pathStyle)
+                }
            
             #get all sub paths for the path of the element
             subPaths, prev = [], 0
@@ -977,94 +1274,55 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                     prev = i
             subPaths.append(raw[prev:])
 
-            #now loop through all sub paths (and flatten if desired) to build up single lines
-            for subPath in subPaths:                     
-                subPathData = CubicSuperPath(subPath)
-
-                #flatten bezier curves. If it was already a straight line do nothing! Otherwise we would split straight lines into a lot more straight linesd)
-                if so.flattenbezier is True and (isBezier is True or isPolyBezMixed is True):
-                    bezier.cspsubdiv(subPathData, so.flatness) #modifies the path
-                    flattenedpath = []
-                    for seg in subPathData:
-                        first = True
-                        for csp in seg:
-                            cmd = 'L'
-                            if first:
-                                cmd = 'M'
-                            first = False
-                            flattenedpath.append([cmd, [csp[1][0], csp[1][1]]])
-                    #self.msg("flattened path = " + str(flattenedpath))
-                    segs = list(CubicSuperPath(flattenedpath).to_segments())
+            #negative composed transform of the parent to put the sub split lines back into the local coordinates. Same for all sub paths
+            negParentMatrix = None
+            if parent != self.svg.root and parent != None:
+                negParentMatrix = (-self._ctm(parent)).matrix
+
+            subPathDatas = [CubicSuperPath(subPath) for subPath in subPaths]
+            #flatten bezier curves (all sub paths at once). If it was already a straight line do nothing! Otherwise we would split straight lines into a lot more straight linesd)
+            flattenedPaths = None
+            if so.flattenbezier is True and (isBezier is True or isPolyBezMixed is True):
+                flattenedPaths = self.flatten_subpaths(subPathDatas, so.flatness)
+
+            #now loop through all sub paths to build up single lines
+            for subPathIndex, subPathData in enumerate(subPathDatas):
+                if flattenedPaths is not None:
+                    #self.msg("flattened path = " + str(flattenedPaths[subPathIndex]))
+                    segs = list(CubicSuperPath(flattenedPaths[subPathIndex]).to_segments())
                 else:
                     segs = list(subPathData.to_segments())
                 #segs = segs[::-1] #reverse the segments
                 
                 #build (poly)lines from segment data
                 subSplitLines = []
-                for i in range(len(segs) - 1): #we could do the same routine to build up (poly)lines using "for x, y in node.path.end_points". See "number nodes" extension
-                    x1, y1, x2, y2 = self.line_from_segments(segs, i, so.decimals)
+                lines = self.lines_from_segments(segs, so.decimals)
+                localLines = lines
+                if negParentMatrix is not None:
+                    #apply line paths with composed negative transform from parent element (all lines at once)
+                    (a, c, e), (b, d, f) = negParentMatrix
+                    localLines = np.round(np.stack([a * lines[..., 0] + c * lines[..., 1] + e, b * lines[..., 0] + d * lines[..., 1] + f], axis=-1), so.decimals)
+                subSplitLineElements = []
+                for i, (((x1, y1), (x2, y2)), ((lx1, ly1), (lx2, ly2))) in enumerate(zip(lines.tolist(), localLines.tolist())): #we could do the same routine to build up (poly)lines using "for x, y in node.path.end_points". See "number nodes" extension
                     #self.msg("(y1 = {},y2 = {},x1 = {},x2 = {})".format(x1, y1, x2, y2))
                     subSplitId = "{}-{}-{}".format(idPrefixSubSplit, originalPathId, i)
-                    line = inkex.PathElement(id=subSplitId)
-                    #apply line path with composed negative transform from parent element
-                    line.attrib['d'] = 'M {},{} L {},{}'.format(x1, y1, x2, y2) #we set the path of Line using 'd' attribute because if we use trimLine.path the decimals get cut off unwantedly
-                    #line.path = [['M', [x1, y1]], ['L', [x2, y2]]]
-                    if pathElement.getparent() != self.svg.root and pathElement.getparent() != None:
-                        line.path = line.path.transform(-pathElement.getparent().composed_transform())
-                    line.style = basicSubSplitLineStyle
-                    line.attrib['originalPathId'] = originalPathId
-                    line.attrib['originalPathIsRelative'] = str(isRelative)
-                    line.attrib['originalPathIsAbsolute'] = str(isAbsolute)
-                    line.attrib['originalPathIsRelAbsMixed'] = str(isRelAbsMixed)
-                    line.attrib['originalPathIsBezier'] = str(isBezier)
-                    line.attrib['originalPathIsPoly'] = str(isPoly)
-                    line.attrib['originalPathIsPolyBezMixed'] = str(isPolyBezMixed)
-                    line.attrib['originalPathIsClosed'] = str(isClosed)
-                    line.attrib['originalPathStyle'] = str(pathElement.style)
+                    #we set the path of Line using 'd' attribute because if we use line.path the decimals get cut off unwantedly.
+                    #The element is created with all attributes at once to skip the inkex property setters
+                    lineAttribs = {'id': subSplitId, 'd': 'M {},{} L {},{}'.format(lx1, ly1, lx2, ly2)}
+                    lineAttribs.update(subSplitLineAttribs)
+                    line = pathElement.makeelement(inkex.addNS('path','svg'), lineAttribs)
                     subSplitLineArray.append(line)
-
-                    if so.subsplit_style == "apply_from_highlightings":
-                        if line.attrib['originalPathIsRelative'] == 'True':
-                            if so.highlight_relative is True:
-                                line.style = relativePathStyle
-                  
-                        if line.attrib['originalPathIsAbsolute'] == 'True':
-                            if so.highlight_absolute is True:
-                                line.style = absolutePathStyle
-                             
-                        if line.attrib['originalPathIsRelAbsMixed'] == 'True':
-                            if so.highlight_rel_abs_mixed is True:
-                                line.style = mixedRelAbsPathStyle
-               
-                        if line.attrib['originalPathIsPoly'] == 'True':
-                            if so.highlight_polylines is True:
-                                line.style = polylinePathStyle
-                                                   
-                        if line.attrib['originalPathIsBezier'] == 'True':
-                            if so.highlight_beziers is True:
-                                line.style = bezierPathStyle
-
-                        if line.attrib['originalPathIsPolyBezMixed'] == 'True':
-                            if so.highlight_poly_bez_mixed is True:
-                                line.style = mixedPolyBezPathStyle
-    
-                        if line.attrib['originalPathIsClosed'] == 'True':
-                            if so.highlight_closed is True:
-                                line.style = closedPathStyle
-                        else:
-                            if so.highlight_opened is True:
-                                line.style = openPathStyle
-                    elif so.subsplit_style == "apply_from_original":
-                        line.style = line.attrib['originalPathStyle']
-
+                    subSplitLineElements.append(line)
                     if so.draw_subsplit is True:
-                        subSplitLineGroup.add(line)
+                        self._subSplitLineEnds[line] = (x1, y1, x2, y2) #global coordinates. Saves parsing the line again for trimming
                     subSplitLines.append([(x1, y1), (x2, y2)])
+                if so.draw_subsplit is True:
+                    subSplitLineGroup.extend(subSplitLineElements)
                     
                 #check for self intersections using Bentley-Ottmann algorithm.
                 isSelfIntersecting = False
                 if so.highlight_self_intersecting is True or so.remove_self_intersecting or so.visualize_self_intersections:
-                    selfIntersectionPoints = isect_segments(subSplitLines, validate=True)
+                    selfIntersectionPoints = self.find_intersections(subSplitLines)
                     if len(selfIntersectionPoints) > 0:
                         isSelfIntersecting = True
                         if so.show_debug is True:
@@ -1080,13 +1338,13 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
     
                         #delete self-intersecting sub split lines and orginal paths
                         if so.remove_self_intersecting:
-                            subSplitLineArray = subSplitLineArray[:len(subSplitLineArray) - len(segs) - 1] #remove all last added lines
+                            del subSplitLineArray[len(subSplitLineArray) - len(segs) - 1:] #remove all last added lines (in place, no copy of the list)
                             pathElement.delete() #and finally delete the orginal path
                             continue
 
             #adjust the style of original paths if desired. Has influence to the finally trimmed lines style results too!
             if so.removefillsetstroke is True:
-                self.adjust_style(pathElement)
+                self.adjust_style(pathElement, adjustedStrokeWidth)
 
             #apply styles to original paths
             if isRelative is True:
@@ -1124,10 +1382,6 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                 if so.highlight_self_intersecting is True:
                     pathElement.style = selfIntersectingPathStyle
 
-            if so.draw_subsplit is True:
-                if subSplitLineGroup is not None: #might get deleted before so we need to check this first
-                    subSplitLineGroup = reversed(subSplitLineGroup) #reverse the order to match the original path segment placing
-
         if so.show_debug is True:
             self.msg("sub split line count: {}".format(len(subSplitLineArray)))   
 
@@ -1155,6 +1409,7 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                             output_line_reversed = 'M {},{} L {},{}'.format(
                                 output['p1'][0], output['p1'][1], output['p0'][0], output['p0'][1])
                             subSplitLine.attrib['d'] = output_line #we set the path using 'd' attribute because if we use trimLine.path the decimals get cut off unwantedly
+                            self._subSplitLineEnds.pop(subSplitLine, None) #the cached end points are outdated now
                             mergedSplitLinePath = subSplitLine.path
                             mergedSplitLinePathReversed = Path(output_line_reversed)
                             #subSplitLine.path = [['M', output['p0']], ['L', output['p1']]] 
@@ -1191,7 +1446,7 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                                 originalPathElement = self.svg.getElementById(originalPathId)
                                 collinearGroup = self.find_group(collinearGroupId)
                                 if collinearGroup is None:
-                                    collinearGroup = originalPathElement.getparent().add(inkex.Group(id=collinearGroupId))
+                                    collinearGroup = self.add_group(originalPathElement.getparent(), collinearGroupId)
                                 collinearGroup.append(subSplitLine) #move to that group
                             #and delete the containg group if empty (can happen in "remove" or "separate_group" constellation
                             if ssl_parent is not None and len(ssl_parent) == 0:
@@ -1213,9 +1468,15 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
         if so.draw_trimmed is True:     
             try:
                 allSubSplitLineStrings = []
+                subSplitLineStrings = [] #same order as subSplitLineArray. Used for trimming
                 for subSplitLine in subSplitLineArray:
-                    csp = Path(subSplitLine.path.transform(subSplitLine.composed_transform())).to_arrays() #will be buggy if draw subsplit lines is deactivated
-                    lineString = [(csp[0][1][0], csp[0][1][1]), (csp[1][1][0], csp[1][1][1])]                    
+                    lineEnds = self._subSplitLineEnds.get(subSplitLine)
+                    if lineEnds is not None and subSplitLine.getroottree().getroot() is self.svg: #cache is only valid as long as the line is in the document
+                        x1, y1, x2, y2 = lineEnds
+                    else:
+                        x1, y1, x2, y2 = self._line_points(subSplitLine, subSplitLine.composed_transform()) #will be buggy if draw subsplit lines is deactivated
+                    lineString = [(x1, y1), (x2, y2)]
+                    subSplitLineStrings.append(LineString(lineString))
                     #lineStringStyle = {'stroke': '#0000FF', 'fill': 'none', 'stroke-width': str(self.svg.unittouu('1px'))}
                     #line = self.svg.get_current_layer().add(inkex.PathElement(id=self.svg.get_unique_id('lineString')))
                     #line.set('d', "M{:0.6f},{:0.6f} L{:0.6f},{:0.6f}".format(lineString[0][0],lineString[0][1],lineString[1][0],lineString[1][1]))
@@ -1232,7 +1493,7 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                         allSubSplitLineStrings.append(lineString)        
                 if so.show_debug is True:
                     self.msg("Going to calculate intersections using Bentley Ottmann Sweep Line Algorithm") 
-                globalIntersectionPoints = MultiPoint(isect_segments(allSubSplitLineStrings, validate=True))       
+                globalIntersectionPoints = self.merge_close_points(self.find_intersections(allSubSplitLineStrings), so.snap_tolerance)
                 if so.show_debug is True:
                     self.msg("global intersection points count: {}".format(len(globalIntersectionPoints)))   
                 if len(globalIntersectionPoints) > 0:
@@ -1244,10 +1505,14 @@ class ContourScannerAndTrimmer(inkex.EffectExtension):
                     We do this path by path to keep the logic between original paths, sub split lines and the final output
                     '''                            
                     allTrimGroups = [] #container to collect all trim groups for later on processing 
+                    allTrimGroupIds = set() #to check if a trim group is already in allTrimGroups without scanning the list
+                    #sort the points by x to find the points close to a line with a binary search
+                    globalIntersectionPoints = globalIntersectionPoints[np.argsort(globalIntersectionPoints[:, 0], kind='stable')]
                     for subSplitIndex in range(len(subSplitLineArray)):
-                        trimGroup = self.build_trim_line_group(subSplitLineArray, subSplitIndex, globalIntersectionPoints)
+                        trimGroup = self.build_trim_line_group(subSplitLineArray, subSplitIndex, subSplitLineStrings[subSplitIndex], globalIntersectionPoints)
                         if trimGroup is not None:
-                            if trimGroup not in allTrimGroups:
+                            if trimGroup.get('id') not in allTrimGroupIds:
+                                allTrimGroupIds.add(trimGroup.get('id'))
                                 allTrimGroups.append(trimGroup)
                  
                     if so.show_debug is True: self.msg("trim groups count: {}".format(len(allTrimGroups)))
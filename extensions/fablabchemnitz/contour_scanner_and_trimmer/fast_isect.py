@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+'''
+Numba compiled line segment intersection for Contour Scanner And Trimmer
+
+This is an optional replacement for poly_point_isect.isect_segments(). It returns the
+same kind of result (a list of (x, y) intersection points) but runs the inner loops as
+compiled code instead of the pure python Bentley-Ottmann sweep line.
+ - for less than SWEEP_THRESHOLD segments we test all pairs, tiled in blocks of BLOCK_SIZE lines
+ - for more segments we use a sweep line with a heap based event queue and only test pairs
+   which overlap in x direction
+
+Requires numba (pip install numba). If numba is not available the importing module has to
+fall back to poly_point_isect.
+
+Author: Mario Voigt / FabLab Chemnitz
+Mail: mario.voigt@stadtfabrikanten.org
+License: GNU GPL v3
+'''
+
+import heapq
+import numpy as np
+from numba import njit
+from numba.typed import List
+
+BLOCK_SIZE = 64
+SWEEP_THRESHOLD = 500
+NUM_EPS = 1e-10 #same as poly_point_isect.NUM_EPS
+NUM_EPS_SQ = NUM_EPS * NUM_EPS
+
+
+@njit(cache=True)
+def _less(ax, ay, bx, by):
+    ''' lexicographic comparison of two points like python does for tuples '''
+    return ax < bx or (ax == bx and ay < by)
+
+
+@njit(cache=True)
+def _seg_intersect(ax, ay, bx, by, cx, cy, dx, dy, ignore_endings):
+    '''
+    parametric intersection test of segment a-b and segment c-d.
+    Returns (found, x, y). Parallel and collinear segments do not intersect (same as poly_point_isect).
+    The range checks allow NUM_EPS of rounding error, else T-junctions are missed (no fastmath for the same reason)
+    '''
+    #order the points the same way like poly_point_isect.isect_seg_seg_v2_point() to get identical results
+    if _less(bx, by, ax, ay):
+        ax, ay, bx, by = bx, by, ax, ay
+    if _less(dx, dy, cx, cy):
+        cx, cy, dx, dy = dx, dy, cx, cy
+    if _less(cx, cy, ax, ay) or (cx == ax and cy == ay and _less(dx, dy, bx, by)):
+        ax, ay, bx, by, cx, cy, dx, dy = cx, cy, dx, dy, ax, ay, bx, by
+
+    div = (bx - ax) * (dy - cy) - (by - ay) * (dx - cx)
+    if div == 0.0:
+        return False, 0.0, 0.0
+
+    ab = ax * by - ay * bx
+    cd = cx * dy - cy * dx
+    x = ((cx - dx) * ab - (ax - bx) * cd) / div
+    y = ((cy - dy) * ab - (ay - by) * cd) / div
+
+    #check that the point is on both segments
+    ux = bx - ax
+    uy = by - ay
+    t = ((x - ax) * ux + (y - ay) * uy) / (ux * ux + uy * uy)
+    if t < -NUM_EPS or t > 1.0 + NUM_EPS:
+        return False, 0.0, 0.0
+    ux = dx - cx
+    uy = dy - cy
+    u = ((x - cx) * ux + (y - cy) * uy) / (ux * ux + uy * uy)
+    if u < -NUM_EPS or u > 1.0 + NUM_EPS:
+        return False, 0.0, 0.0
+
+    if ignore_endings: #both segments only touch each other with their end points
+        if (((x - ax) ** 2 + (y - ay) ** 2 < NUM_EPS_SQ or (x - bx) ** 2 + (y - by) ** 2 < NUM_EPS_SQ) and
+            ((x - cx) ** 2 + (y - cy) ** 2 < NUM_EPS_SQ or (x - dx) ** 2 + (y - dy) ** 2 < NUM_EPS_SQ)):
+            return False, 0.0, 0.0
+    return True, x, y
+
+
+@njit(cache=True)
+def _append(buf, n, x, y):
+    ''' add a point to the result buffer and grow the buffer if required '''
+    if n == buf.shape[0]:
+        newBuf = np.empty((buf.shape[0] * 2, 2), dtype=np.float64)
+        newBuf[:n] = buf[:n]
+        buf = newBuf
+    buf[n, 0] = x
+    buf[n, 1] = y
+    return buf, n + 1
+
+
+@njit(cache=True)
+def _test_pair(segs, i, j, ignore_endings, buf, n):
+    ''' bounding box rejection followed by the exact test of segment i and j '''
+    if max(segs[i, 0], segs[i, 2]) < min(segs[j, 0], segs[j, 2]) or \
+       max(segs[j, 0], segs[j, 2]) < min(segs[i, 0], segs[i, 2]) or \
+       max(segs[i, 1], segs[i, 3]) < min(segs[j, 1], segs[j, 3]) or \
+       max(segs[j, 1], segs[j, 3]) < min(segs[i, 1], segs[i, 3]):
+        return buf, n
+    found, x, y = _seg_intersect(segs[i, 0], segs[i, 1], segs[i, 2], segs[i, 3],
+                                 segs[j, 0], segs[j, 1], segs[j, 2], segs[j, 3], ignore_endings)
+    if found:
+        buf, n = _append(buf, n, x, y)
+    return buf, n
+
+
+@njit(cache=True)
+def _all_intersections(segs, ignore_endings):
+    ''' test all pairs of segments. The pairs are tiled in blocks for better cache locality '''
+    count = segs.shape[0]
+    buf = np.empty((max(count, 16), 2), dtype=np.float64)
+    n = 0
+    for ib in range(0, count, BLOCK_SIZE):
+        for jb in range(ib, count, BLOCK_SIZE):
+            for i in range(ib, min(ib + BLOCK_SIZE, count)):
+                for j in range(max(jb, i + 1), min(jb + BLOCK_SIZE, count)):
+                    buf, n = _test_pair(segs, i, j, ignore_endings, buf, n)
+    return buf[:n]
+
+
+@njit(cache=True)
+def bo_intersections(segs, ignore_endings):
+    '''
+    sweep line from left to right over the segments (shape (N, 2, 2), left point first).
+    The events (segment starts and ends) are kept in a heap. A starting segment is only tested against
+    the currently active segments, which are the ones overlapping the sweep line in x direction
+    '''
+    count = segs.shape[0]
+    flat = segs.reshape(count, 4)
+    events = List()
+    for i in range(count):
+        events.append((segs[i, 0, 0], 0, i)) #0 = start. Starts come before ends at the same x to catch touching segments
+        events.append((segs[i, 1, 0], 1, i)) #1 = end
+    heapq.heapify(events)
+    active = np.empty(count, dtype=np.int64)
+    position = np.full(count, -1, dtype=np.int64)
+    activeCount = 0
+    buf = np.empty((max(count, 16), 2), dtype=np.float64)
+    n = 0
+    while len(events) > 0:
+        x, kind, i = heapq.heappop(events)
+        if kind == 0:
+            for k in range(activeCount):
+                buf, n = _test_pair(flat, active[k], i, ignore_endings, buf, n)
+            active[activeCount] = i
+            position[i] = activeCount
+            activeCount += 1
+        else: #remove by swapping the last active segment into the free slot
+            k = position[i]
+            activeCount -= 1
+            last = active[activeCount]
+            active[k] = last
+            position[last] = k
+    return buf[:n]
+
+
+def isect_segments(segments, ignore_segment_endings=True):
+    '''
+    find all intersections of the given segments [((x1, y1), (x2, y2)), ...]
+    Returns a list of (x, y) tuples without duplicates
+    '''
+    segs = np.asarray(segments, dtype=np.float64).reshape(-1, 4).copy()
+    #remove single points and duplicates (same as poly_point_isect with validate=True)
+    swap = (segs[:, 2] < segs[:, 0]) | ((segs[:, 2] == segs[:, 0]) & (segs[:, 3] < segs[:, 1]))
+    segs[swap] = segs[swap][:, [2, 3, 0, 1]]
+    segs = segs[(segs[:, 0] != segs[:, 2]) | (segs[:, 1] != segs[:, 3])]
+    if len(segs) < 2:
+        return []
+    segs = np.unique(segs, axis=0)
+    if len(segs) < SWEEP_THRESHOLD:
+        points = _all_intersections(segs, ignore_segment_endings)
+    else:
+        points = bo_intersections(segs.reshape(-1, 2, 2), ignore_segment_endings)
+    return list(dict.fromkeys(map(tuple, points.tolist())))
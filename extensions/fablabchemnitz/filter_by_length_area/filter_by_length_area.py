@@ -17,13 +17,66 @@ ToDo:
 import sys
 import colorsys
 import copy
+from collections import namedtuple
+from operator import attrgetter
+import numpy as np
 import inkex
 from inkex import Color, CubicSuperPath
-from inkex.bezier import csplength, csparea
 
 sys.path.append("../remove_empty_groups")
 sys.path.append("../apply_transformations")
 
+#Gauss-Legendre quadrature: 16 nodes on each of 4 sub intervals of t = [0, 1]. More accurate than inkex.bezier.csplength with its default tolerance
+GAUSS_PARTS = 4
+_gaussNodes, _gaussWeights = np.polynomial.legendre.leggauss(16)
+GAUSS_T = (((_gaussNodes + 1) / 2 + np.arange(GAUSS_PARTS)[:, None]) / GAUSS_PARTS).ravel()
+GAUSS_W = np.tile(_gaussWeights / (2 * GAUSS_PARTS), GAUSS_PARTS)
+IDENTITY_MATRIX = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0)) #exact compare. Transform's == has a tolerance
+MAT_AREA = np.array([[0, 2, 1, -3], [-2, 0, 1, 1], [-1, -1, 0, 2], [3, -1, -2, 0]])
+
+Entry = namedtuple('Entry', 'element value type') #one filtered element with its measured value
+
+def csp_segments(csp):
+    ''' returns the control points of all bezier segments of a cubic super path as four (N, 2) arrays '''
+    p0, p1, p2, p3 = [], [], [], []
+    for sp in csp:
+        if len(sp) < 2:
+            continue
+        sp = np.asarray(sp, dtype=np.float64)
+        p0.append(sp[:-1, 1])
+        p1.append(sp[:-1, 2])
+        p2.append(sp[1:, 0])
+        p3.append(sp[1:, 1])
+    if len(p0) == 0:
+        return None
+    return np.concatenate(p0), np.concatenate(p1), np.concatenate(p2), np.concatenate(p3)
+
+def csplength(csp):
+    ''' total length of a cubic super path. Same as inkex.bezier.csplength()[1] but evaluates all segments at once '''
+    segments = csp_segments(csp)
+    if segments is None:
+        return 0.0
+    p0, p1, p2, p3 = segments
+    t = GAUSS_T[:, None, None]
+    derivative = 3 * ((1 - t) ** 2 * (p1 - p0) + 2 * (1 - t) * t * (p2 - p1) + t ** 2 * (p3 - p2))
+    return float(np.dot(GAUSS_W, np.linalg.norm(derivative, axis=-1)).sum())
+
+def csparea(csp):
+    ''' signed area of a cubic super path. Same as inkex.bezier.csparea() but evaluates all segments at once '''
+    area = 0.0
+    for sp in csp: #polygon area of the nodes
+        if len(sp) < 2:
+            continue
+        nodes = np.asarray(sp, dtype=np.float64)[:, 1]
+        area += 0.5 * np.sum(np.roll(nodes[:, 0], 1) * (nodes[:, 1] - np.roll(nodes[:, 1], 2)))
+    segments = csp_segments(csp)
+    if segments is not None: #add the contribution of the cubic beziers
+        p0, p1, p2, p3 = segments
+        vecX = np.stack((p0[:, 0], p1[:, 0], p2[:, 0], p3[:, 0]), axis=1)
+        vecY = np.stack((p0[:, 1], p1[:, 1], p2[:, 1], p3[:, 1]), axis=1)
+        area += 0.15 * np.sum((vecX @ MAT_AREA) * vecY)
+    return float(-area)
+
 class FilterByLengthArea(inkex.EffectExtension):
     
     def add_arguments(self, pars):
@@ -87,12 +140,12 @@ class FilterByLengthArea(inkex.EffectExtension):
                         prev = i
                 subPaths = subPaths[::-1]
                     
+            oldId = element.get('id')
             for subpath in subPaths:
                 #self.msg(subpath)
-                replacedelement = copy.copy(element)
-                oldId = replacedelement.get('id')
                 csp = CubicSuperPath(subpath)
                 if len(subpath) > 1 and csp[0][0] != csp[0][1]: #avoids pointy paths like M "31.4794 57.6024 Z"
+                    replacedelement = copy.copy(element) #copy only the sub paths we keep
                     replacedelement.set('d', csp)
                     if len(subPaths) == 1:
                         replacedelement.set('id', "{}".format(oldId))
@@ -102,14 +155,29 @@ class FilterByLengthArea(inkex.EffectExtension):
                     parent.insert(idx, replacedelement)
                     breakelements.append(replacedelement)
             parent.remove(element)
-        for child in element.getchildren():
+        for child in list(element): #snapshot, the children get replaced while breaking
             self.breakContours(child, breakelements)
         return breakelements
         
+    def composedTransform(self, element):
+        '''
+        same as element.composed_transform() but the transforms of the ancestors are cached. Many elements share the
+        same parents, so each ancestor chain is only multiplied once. The own transform of the element is not cached
+        because it might get changed by 'Apply Transformations'
+        '''
+        parent = element.getparent()
+        if not isinstance(parent, inkex.BaseElement):
+            return element.transform
+        parentTransform = self._ctmCache.get(parent)
+        if parentTransform is None:
+            parentTransform = self._ctmCache[parent] = self.composedTransform(parent)
+        return parentTransform @ element.transform
+
     def effect(self):
         global to_sort, so
         to_sort = []
         so = self.options
+        self._ctmCache = {}
        
         applyTransformationsAvailable = False # at first we apply external extension
         try:
@@ -138,73 +206,84 @@ class FilterByLengthArea(inkex.EffectExtension):
         if so.debug is True: 
             inkex.utils.debug("Collecting svg:path elements ...")
             
+        #the thresholds do not change from element to element, so we convert them only once
+        minLengthThreshold = so.min_threshold * unit_factor
+        maxLengthThreshold = so.max_threshold * unit_factor
+        minAreaThreshold = so.min_threshold * (unit_factor * unit_factor)
+        maxAreaThreshold = so.max_threshold * (unit_factor * unit_factor)
+        nodesInterval = self.svg.unittouu(str(so.nodes_interval) + so.unit)
+        if so.measure == "nodes" and (so.min_filter_enable is True or so.max_filter_enable is True): #the densities are only required for filtering
+            if nodesInterval == 0:
+                inkex.utils.debug("Interval is zero. Please adjust.")
+                return
+            minNodesDensity = so.min_nodes / nodesInterval
+            maxNodesDensity = so.max_nodes / nodesInterval
+            
         for element in elements: 
             # additional option to apply transformations. As we clear up some groups to form new layers, we might lose translations, rotations, etc.
             if so.apply_transformations is True and applyTransformationsAvailable is True:
                 apply_transformations.ApplyTransformations().recursiveFuseTransform(element) 
             
             try:
-                csp = element.path.transform(element.composed_transform()).to_superpath()
+                transform = self.composedTransform(element)
+                path = element.path if transform.matrix == IDENTITY_MATRIX else element.path.transform(transform) #skip the copy of untransformed paths
+                csp = path.to_superpath()
 
                 if so.measure == "area":
                     area = round(-csparea(csp), so.precision) #is returned as negative value. we need to invert with
-                    if (so.min_filter_enable is True and area < (so.min_threshold * (unit_factor * unit_factor))) or \
-                       (so.max_filter_enable is True and area >= (so.max_threshold * (unit_factor * unit_factor))) or \
+                    if (so.min_filter_enable is True and area < minAreaThreshold) or \
+                       (so.max_filter_enable is True and area >= maxAreaThreshold) or \
                        (so.min_filter_enable is False and so.max_filter_enable is False): #complete selection
                         if so.debug is True: 
                             inkex.utils.debug("id={}, area={:0.3f}{}^2".format(element.get('id'), area, so.unit))
-                        to_sort.append({'element': element, 'value': area, 'type': 'area'})
+                        to_sort.append(Entry(element, area, 'area'))
                                        
                 elif so.measure == "length":
-                    slengths, stotal = csplength(csp) #get segment lengths and total length of path in document's internal unit
+                    stotal = csplength(csp) #get total length of path in document's internal unit
                     stotal = round(stotal, so.precision)
-                    if (so.min_filter_enable is True and stotal < (so.min_threshold * unit_factor)) or \
-                       (so.max_filter_enable is True and stotal >= (so.max_threshold * unit_factor)) or \
+                    if (so.min_filter_enable is True and stotal < minLengthThreshold) or \
+                       (so.max_filter_enable is True and stotal >= maxLengthThreshold) or \
                        (so.min_filter_enable is False and so.max_filter_enable is False): #complete selection
                         if so.debug is True: 
                             inkex.utils.debug("id={}, length={:0.3f}{}".format(element.get('id'), self.svg.uutounit(str(stotal), so.unit), so.unit))
-                        to_sort.append({'element': element, 'value': stotal, 'type': 'length'})
+                        to_sort.append(Entry(element, stotal, 'length'))
                                        
                 elif so.measure == "nodes":
-                    slengths, stotal = csplength(csp) #get segment lengths and total length of path in document's internal unit
+                    stotal = csplength(csp) #get total length of path in document's internal unit
                     stotal = round(stotal, so.precision)
                     nodes = len(element.path)
-                    if (so.min_filter_enable is True and nodes / stotal < so.min_nodes / self.svg.unittouu(str(so.nodes_interval) + so.unit)) or \
-                       (so.max_filter_enable is True and nodes / stotal > so.max_nodes / self.svg.unittouu(str(so.nodes_interval) + so.unit)) or \
+                    if (so.min_filter_enable is True and nodes / stotal < minNodesDensity) or \
+                       (so.max_filter_enable is True and nodes / stotal > maxNodesDensity) or \
                        (so.min_filter_enable is False and so.max_filter_enable is False): #complete selection
                         if so.debug is True: 
                             inkex.utils.debug("id={}, length={:0.3f}{}, nodes={}".format(element.get('id'), self.svg.uutounit(str(stotal), so.unit), so.unit, nodes))
-                        to_sort.append({'element': element, 'value': nodes, 'type': 'nodes'})
+                        to_sort.append(Entry(element, nodes, 'nodes'))
 
             except Exception as e:
                 #inkex.utils.debug(e)
                 pass
             
-        for i in range(0, len(to_sort)):
-            element = to_sort[i].get('element')   
-            if so.delete is True:
-                element.delete()
-                
         if so.delete is True:
+            for entry in to_sort:
+                entry.element.delete()
             return #quit here
             
         if so.sort_by_value is True:
-            to_sort.sort(key=lambda x: x.get('value')) #sort by target value
+            to_sort.sort(key=attrgetter('value')) #sort by target value
             
         if so.sort_by_id is True:
-            to_sort.sort(key=lambda x: x.get('element').get('id')) #sort by id. will override previous value sort
+            to_sort.sort(key=lambda entry: entry.element.get('id')) #sort by id. will override previous value sort
             
         if so.group is True:
             group = inkex.Group(id=self.svg.get_unique_id("filtered"))
             self.svg.get_current_layer().add(group)          
             
         allIds = self.svg.get_ids()
-        newIds = [] #we pre-populate this
-        for i in range(0, len(to_sort)):
-            newIds.append("{}{}".format(element.tag.replace('{http://www.w3.org/2000/svg}',''), i)) #should be element tag 'path'
+        #we pre-populate this. Each id is built from the tag of its own element (like 'path0')
+        newIds = ["{}{}".format(entry.element.tag.rpartition('}')[2], i) for i, entry in enumerate(to_sort)]
                    
-        for i in range(0, len(to_sort)):
-            element = to_sort[i].get('element')
+        for i, entry in enumerate(to_sort):
+            element = entry.element
             
             if so.rename_ids is True:
                 if newIds[i] in allIds: #already exist. lets rename that one before using it's id for the recent element
@@ -241,7 +320,7 @@ class FilterByLengthArea(inkex.EffectExtension):
                 element.style['stroke'] = so.color_single              
                 
             if so.set_labels is True:
-                element.set('inkscape:label', "{}={}".format(to_sort[i].get('type'), to_sort[i].get('value')))
+                element.set('inkscape:label', "{}={}".format(entry.type, entry.value))
                 
             if so.remove_labels is True:
                 element.pop('inkscape:label')
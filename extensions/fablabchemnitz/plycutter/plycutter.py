@@ -1,13 +1,66 @@
 #!/usr/bin/env python3
 import sys
 import os
+import io
+import inspect
+import logging
+import traceback
 import inkex
 import tempfile
 import subprocess
+from contextlib import redirect_stdout, redirect_stderr
 from subprocess import Popen, PIPE
 from lxml import etree
 from inkex import Transform
 
+INKSCAPE_EXTENSIONS_DIR = '/usr/share/inkscape/extensions'
+
+def run_plycutter(plycutter_cmd):
+    '''
+    try to run the command line entry of plycutter in the same process (saves starting another python interpreter).
+    The arguments are passed by sys.argv, the same way the plycutter script gets them, and also as list if main() takes
+    an argument list.
+    The extensions dir is hidden until plycutter returns (not only while importing) because there's a collision with
+    "rtree.py", also for imports done later inside plycutter. This extension's dir is hidden too, because this file
+    (plycutter.py) would shadow the plycutter package.
+    stdout and stderr are captured because stdout is used to return the document to InkScape. This includes logging
+    handlers which were bound to the original streams before.
+    Returns (returncode, stdout, stderr) or None if plycutter is not importable
+    '''
+    ownDir = os.path.dirname(os.path.abspath(__file__))
+    oldPath, oldArgv = sys.path, sys.argv
+    sys.path = [d for d in sys.path if d != INKSCAPE_EXTENSIONS_DIR and os.path.abspath(d or os.curdir) != ownDir]
+    try:
+        try:
+            from plycutter.command_line import main
+        except ImportError:
+            return None
+        stdout, stderr = io.StringIO(), io.StringIO()
+        loggers = [logging.getLogger()] + [l for l in logging.Logger.manager.loggerDict.values() if isinstance(l, logging.Logger)]
+        retargeted = []
+        for handler in set(h for l in loggers for h in l.handlers):
+            if isinstance(handler, logging.StreamHandler) and handler.stream in (sys.stdout, sys.__stdout__, sys.stderr, sys.__stderr__):
+                capture = stdout if handler.stream in (sys.stdout, sys.__stdout__) else stderr
+                retargeted.append((handler, handler.setStream(capture)))
+        returncode = 0
+        sys.argv = plycutter_cmd
+        args = (plycutter_cmd[1:],) if len(inspect.signature(main).parameters) > 0 else ()
+        try:
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    main(*args)
+                except SystemExit as e:
+                    returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                except Exception:
+                    traceback.print_exc()
+                    returncode = 1
+        finally:
+            for handler, stream in retargeted:
+                handler.setStream(stream)
+        return returncode, stdout.getvalue(), stderr.getvalue()
+    finally:
+        sys.path, sys.argv = oldPath, oldArgv
+
 class PlyCutter(inkex.EffectExtension):
     
     def add_arguments(self, pars):
@@ -31,72 +84,58 @@ class PlyCutter(inkex.EffectExtension):
             inkex.utils.debug("The input file does not exist. Please select a proper file and try again.")
             exit(1)
 
-        # Prepare output
+        # Prepare output. Each run writes into its own temporary directory (removed after importing or on errors), so there
+        # is no previously generated output file to clean up
         basename =  os.path.splitext(os.path.basename(stl_input))[0]
-        svg_output = os.path.join(tempfile.gettempdir(), basename + ".svg")
+        with tempfile.TemporaryDirectory(prefix="plycutter-") as tmpDir: #also removed when leaving by exit() on errors
+            svg_output = os.path.join(tmpDir, basename + ".svg")
 
-        # Clean up possibly previously generated output file from plycutter
-        if os.path.exists(svg_output):
-            try:
-                os.remove(svg_output)
-            except OSError as e: 
-                inkex.utils.debug("Error while deleting previously generated output file " + stl_input)
-
-        # Run PlyCutter
-        plycutter_cmd = "plycutter "
-        plycutter_cmd += "--thickness " + str(self.options.thickness) + " "
-        if self.options.debug == True: plycutter_cmd += "--debug "
-        plycutter_cmd += "--min_finger_width " + str(self.options.min_finger_width) + " "
-        plycutter_cmd += "--max_finger_width " + str(self.options.max_finger_width) + " "
-        plycutter_cmd += "--support_radius " + str(self.options.support_radius) + " "
-        plycutter_cmd += "--final_dilation " + str(self.options.final_dilation) + " "
-        plycutter_cmd += "--random_seed " + str(self.options.random_seed) + " "
-        plycutter_cmd += "--format svg " #static
-        plycutter_cmd += "-o \"" + svg_output + "\" "
-        plycutter_cmd += "\"" + stl_input + "\""
+            # Run PlyCutter. The arguments are passed as list, so no shell is required and paths with spaces need no quoting
+            plycutter_cmd = ["plycutter"]
+            plycutter_cmd += ["--thickness", str(self.options.thickness)]
+            if self.options.debug == True: plycutter_cmd += ["--debug"]
+            plycutter_cmd += ["--min_finger_width", str(self.options.min_finger_width)]
+            plycutter_cmd += ["--max_finger_width", str(self.options.max_finger_width)]
+            plycutter_cmd += ["--support_radius", str(self.options.support_radius)]
+            plycutter_cmd += ["--final_dilation", str(self.options.final_dilation)]
+            plycutter_cmd += ["--random_seed", str(self.options.random_seed)]
+            plycutter_cmd += ["--format", "svg"] #static
+            plycutter_cmd += ["-o", svg_output]
+            plycutter_cmd += [stl_input]
         
-        #print command 
-        #inkex.utils.debug(plycutter_cmd)
+            #print command 
+            #inkex.utils.debug(" ".join(plycutter_cmd))
     
-        #create a new env for subprocess which does not contain extensions dir because there's a collision with "rtree.py"
-        pypath = ''
-        for d in sys.path:
-            if d != '/usr/share/inkscape/extensions':
-                pypath = pypath + d + ';'
-        neutral_env = os.environ.copy()
-        neutral_env['PYTHONPATH'] = pypath
+            result = run_plycutter(plycutter_cmd)
+            if result is not None:
+                returncode, stdout, stderr = result
+            else:
+                #create a new env for subprocess which does not contain extensions dir because there's a collision with "rtree.py"
+                neutral_env = os.environ.copy()
+                neutral_env['PYTHONPATH'] = os.pathsep.join(d for d in sys.path if d != INKSCAPE_EXTENSIONS_DIR)
 
-        p = Popen(plycutter_cmd, shell=True, stdout=PIPE, stderr=PIPE, env=neutral_env)
-        stdout, stderr = p.communicate()
+                p = Popen(plycutter_cmd, shell=False, stdout=PIPE, stderr=PIPE, env=neutral_env, encoding='utf-8', errors='replace') #decoded output, same as in-process
+                stdout, stderr = p.communicate() #waits for the process too
+                returncode = p.returncode
 
-        p.wait()
-        if p.returncode != 0: 
-           inkex.utils.debug("PlyCutter failed: %d %s %s" % (p.returncode, 
-                str(stdout).replace('\\n', '\n').replace('\\t', '\t'), 
-                str(stderr).replace('\\n', '\n').replace('\\t', '\t'))
-                )
-           exit(1)
-        elif self.options.debug is True: 
-           inkex.utils.debug("PlyCutter debug output: %d %s %s" % (p.returncode, 
-                str(stdout).replace('\\n', '\n').replace('\\t', '\t'), 
-                str(stderr).replace('\\n', '\n').replace('\\t', '\t'))
-                )
+            if returncode != 0: 
+               inkex.utils.debug("PlyCutter failed: %d %s %s" % (returncode, stdout, stderr))
+               exit(1)
+            elif self.options.debug is True: 
+               inkex.utils.debug("PlyCutter debug output: %d %s %s" % (returncode, stdout, stderr))
 
-        # Write the generated SVG into InkScape's canvas
-        try:
-            stream = open(svg_output, 'r')
-        except FileNotFoundError as e:
-            inkex.utils.debug("There was no SVG output generated by PlyCutter. Please check your model file.")
-            exit(1)
-        p = etree.XMLParser(huge_tree=True)
-        doc = etree.parse(stream, parser=etree.XMLParser(huge_tree=True)).getroot()
-        stream.close()
+            # Write the generated SVG into InkScape's canvas
+            if not os.path.exists(svg_output):
+                inkex.utils.debug("There was no SVG output generated by PlyCutter. Please check your model file.")
+                exit(1)
         
-        g = inkex.Group(id=self.svg.get_unique_id("plycutter-"))
-        g.insert(0, inkex.Desc("Imported file: {}".format(self.options.infile)))
-        self.svg.get_current_layer().add(g)
-        for element in doc.iter("{http://www.w3.org/2000/svg}path"):
-            g.append(element)
+            g = inkex.Group(id=self.svg.get_unique_id("plycutter-"))
+            g.insert(0, inkex.Desc("Imported file: {}".format(self.options.infile)))
+            self.svg.get_current_layer().add(g)
+            #stream the paths instead of parsing the whole document first. Each path is moved out of the parsed tree
+            #as soon as it is complete, so the parsed tree does not grow with the output size
+            for event, element in etree.iterparse(svg_output, events=("end",), tag="{http://www.w3.org/2000/svg}path", huge_tree=True):
+                g.append(element)
             
         #Adjust viewport and width/height to have the import at the center of the canvas
         if self.options.resizetoimport:
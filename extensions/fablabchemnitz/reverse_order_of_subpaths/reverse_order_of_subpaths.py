@@ -23,15 +23,10 @@ class ReverseOrderOfSubpaths(inkex.EffectExtension):
     
     def reverse(self, element):
         if element.tag == inkex.addNS('path','svg'):
-            new = []
             sub = element.path.to_superpath()
-            i = 0
-            while i < len(sub):
-                new.append(sub[-1-i])
-                i += 1    
-            element.path = CubicSuperPath(new).to_path(curves_only=True)
+            element.path = CubicSuperPath(sub[::-1]).to_path(curves_only=True)
         elif element.tag == inkex.addNS('g','svg'):
-            for child in element.getchildren():
+            for child in element:
                 self.reverse(child)
     
     def effect(self):
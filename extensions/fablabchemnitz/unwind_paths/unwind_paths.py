@@ -24,19 +24,43 @@ ToDos:
 - option to add segment/surface numbers
 """
 import copy
+import numpy as np
 import inkex
-from inkex import Color, bezier, Path, CubicSuperPath, TextElement, Tspan
-from inkex.bezier import csplength
-from lxml import etree
+from inkex import Color, CubicSuperPath, TextElement, Tspan
 import math
-import random
+
+#Gauss-Legendre quadrature: 16 nodes on each of 16 sub intervals of t = [0, 1]. More accurate than inkex.bezier.cspseglength with its
+#default tolerance, also for segments with (nearly) cusps, where fewer sub intervals are not enough
+GAUSS_PARTS = 16
+_gaussNodes, _gaussWeights = np.polynomial.legendre.leggauss(16)
+GAUSS_T = (((_gaussNodes + 1) / 2 + np.arange(GAUSS_PARTS)[:, None]) / GAUSS_PARTS).ravel()
+GAUSS_W = np.tile(_gaussWeights / (2 * GAUSS_PARTS), GAUSS_PARTS)
+
+def csp_segment_lengths(csp):
+    ''' returns the lengths of all bezier segments of a cubic super path (sub path after sub path) as list. All segments are measured at once '''
+    p0, p1, p2, p3 = [], [], [], []
+    for sp in csp:
+        if len(sp) < 2:
+            continue
+        sp = np.asarray(sp, dtype=np.float64)
+        p0.append(sp[:-1, 1])
+        p1.append(sp[:-1, 2])
+        p2.append(sp[1:, 0])
+        p3.append(sp[1:, 1])
+    if len(p0) == 0:
+        return []
+    p0, p1, p2, p3 = np.concatenate(p0), np.concatenate(p1), np.concatenate(p2), np.concatenate(p3)
+    t = GAUSS_T[:, None, None]
+    derivative = 3 * ((1 - t) ** 2 * (p1 - p0) + 2 * (1 - t) * t * (p2 - p1) + t ** 2 * (p3 - p2))
+    return np.dot(GAUSS_W, np.linalg.norm(derivative, axis=-1)).tolist()
 
 class UnwindPaths(inkex.EffectExtension):
     
-    #draw an SVG line segment between the given (raw) points
-    def drawline(self, pathData, name, parent, line_style):
-        line_attribs = {'style' : str(inkex.Style(line_style)),  inkex.addNS('label','inkscape') : name,  'd' : pathData}
-        line = etree.SubElement(parent, inkex.addNS('path','svg'), line_attribs )
+    #create an SVG line segment between the given (raw) points. line_style is an already serialized style string.
+    #The caller adds the lines to their group in batches (extend)
+    def drawline(self, pathData, name, line_style):
+        line_attribs = {'style' : line_style,  inkex.addNS('label','inkscape') : name,  'd' : pathData}
+        return self.svg.makeelement(inkex.addNS('path','svg'), line_attribs)
         
     def add_arguments(self, pars):
         pars.add_argument('--tab')
@@ -58,23 +82,20 @@ class UnwindPaths(inkex.EffectExtension):
     def breakContours(self, element, breakelements = None): #this does the same as "CTRL + SHIFT + K"
         if breakelements == None:
             breakelements = []
-        if element.tag == inkex.addNS('path','svg'):
-            parent = element.getparent()
-            idx = parent.index(element)
+        for pathElement in list(element.iter(inkex.addNS('path','svg'))): #snapshot, the paths get replaced while breaking. No recursion required
+            parent = pathElement.getparent()
+            idx = parent.index(pathElement)
             idSuffix = 0    
-            raw = element.path.to_arrays()
-            subPaths, prev = [], 0
-            for i in range(len(raw)): # Breaks compound paths into simple paths
-                if raw[i][0] == 'M' and i != 0:
-                    subPaths.append(raw[prev:i])
-                    prev = i
-            subPaths.append(raw[prev:])
+            raw = pathElement.path.to_arrays()
+            # Breaks compound paths into simple paths (each one starts with a M command)
+            starts = [0] + [i for i, seg in enumerate(raw) if seg[0] == 'M' and i != 0] + [len(raw)]
+            subPaths = [raw[start:end] for start, end in zip(starts, starts[1:])]
             if len(subPaths) > 1:
+                oldId = pathElement.get('id')
                 for subpath in subPaths:
-                    replacedelement = copy.copy(element)
-                    oldId = replacedelement.get('id')
                     csp = CubicSuperPath(subpath)
                     if len(subpath) > 1 and csp[0][0] != csp[0][1]: #avoids pointy paths like M "31.4794 57.6024 Z"
+                        replacedelement = copy.copy(pathElement) #copy only the sub paths we keep
                         replacedelement.set('d', csp)
                         if len(subPaths) == 1:
                             replacedelement.set('id', oldId)
@@ -83,11 +104,9 @@ class UnwindPaths(inkex.EffectExtension):
                             idSuffix += 1
                         parent.insert(idx, replacedelement)
                         breakelements.append(replacedelement)
-                parent.remove(element)
+                parent.remove(pathElement)
             else:
-                breakelements.append(element)
-            for child in element.getchildren():
-                self.breakContours(child, breakelements)
+                breakelements.append(pathElement)
         return breakelements
 
     def rgb(self, minimum, maximum, value):
@@ -106,6 +125,16 @@ class UnwindPaths(inkex.EffectExtension):
         if self.options.colorize is True:
             self.options.break_apart = True #required to make it work
 
+        #the options and styles do not change while running, so we look them up only once (not for each segment)
+        breakApart = self.options.break_apart
+        colorize = self.options.colorize
+        extrude = self.options.extrude
+        number = self.options.number
+        strokeWidth = self.svg.unittouu('1px')
+        rng = np.random.default_rng()
+        blackLineStyle = str(inkex.Style({'stroke':'#000000','stroke-width':strokeWidth,'fill':'none'}))
+        currentLayer = self.svg.get_current_layer()
+
         if len(self.svg.selected) > 0:
             #we break apart combined paths to get distinct contours
             breakApartPaths = []
@@ -114,82 +143,80 @@ class UnwindPaths(inkex.EffectExtension):
                 
             for breakApartPath in breakApartPaths:
                 for element in breakApartPath:
-                    elemGroup = self.svg.get_current_layer().add(inkex.Group(id="unwinding-" + element.get('id')))
+                    elementId = element.get('id')
+                    elemGroup = currentLayer.add(inkex.Group(id="unwinding-" + elementId))
         
                     #beginning point of the unwind band:
                     bbox = element.bounding_box() #shift the element to the bottom of the element
                     xmin = bbox.left
                     ymax = bbox.bottom + bbox.height * 0.1 #10% additional spacing
            
-                    csp = element.path.to_superpath()
-                    subCount = len(element.path)
+                    path = element.path #parse the path data only once
+                    csp = path.to_superpath()
+                    subCount = len(path)
                     
                     #generate random colors; used to identify glue tab pairs
-                    if self.options.colorize is True:
+                    if colorize is True:
                         colorSet = []
                         if self.options.randomize_colors is True:
-                            while len(colorSet) < subCount - 1:
-                                    r = lambda: random.randint(0,255)
-                                    newColor = '#%02X%02X%02X' % (r(),r(),r())
-                                    if newColor not in colorSet:
-                                        colorSet.append(newColor)
+                            #draw distinct 24 bit colors in one go (no duplicates, so each glue pair keeps its own color)
+                            colorSet = ['#%06X' % color for color in rng.choice(1 << 24, size=max(subCount - 1, 0), replace=False).tolist()]
                         else:
                             for i in range(subCount):
                                 colorSet.append(Color(self.rgb(0, i+self.options.color_increment, 1*i)))        
                     
-                    slengths, stotal = csplength(csp) #get segment lengths and total length of path in document's internal unit
-                    #self.msg(stotal) #total length of the path
+                    segmentLengths = csp_segment_lengths(csp) #get segment lengths of all sub paths in document's internal unit
+                    #self.msg(sum(segmentLengths)) #total length of the path
+                    firstSegment = 0 #index of the first segment of the next sub path in segmentLengths
                     
                     for sub in csp:
+                        subSegmentCount = max(len(sub) - 1, 0)
+                        subLengths = segmentLengths[firstSegment:firstSegment + subSegmentCount]
+                        firstSegment += subSegmentCount
                         #generate new horizontal line data by measuring each segment
-                        new = []
-                        new.append([sub[0]])
                         i = 1
-                        topPathData = "m {:0.6f},{:0.6f} ".format(xmin, ymax)
-                        bottomPathData = "m {:0.6f},{:0.6f} ".format(xmin, ymax + shifting)
-                        lengths = []
+                        lengths = (np.asarray(subLengths) + to).tolist() #all segment lengths incl. thickness offset
+                        unwoundLength = 0 #running sum of lengths. Saves summing up the whole list for each segment
     
-                        if self.options.break_apart is True:
-                            topLineGroup = self.svg.get_current_layer().add(inkex.Group(id="hline-top-" + element.get('id')))
-                            bottomLineGroup = self.svg.get_current_layer().add(inkex.Group(id="hline-bottom-" + element.get('id')))
+                        if breakApart is True:
+                            topLineGroup = currentLayer.add(inkex.Group(id="hline-top-" + elementId))
+                            bottomLineGroup = currentLayer.add(inkex.Group(id="hline-bottom-" + elementId))
                             elemGroup.append(topLineGroup)      
                             elemGroup.append(bottomLineGroup)
                             
-                            newOriginalPathGroup = self.svg.get_current_layer().add(inkex.Group(id="new-original-" + element.get('id')))
-                            self.svg.get_current_layer().append(newOriginalPathGroup) #we want this to be one level above unwound stuff
+                            newOriginalPathGroup = currentLayer.add(inkex.Group(id="new-original-" + elementId))
+                            currentLayer.append(newOriginalPathGroup) #we want this to be one level above unwound stuff
                     
-                        if self.options.extrude is True:
-                            vlinesGroup = self.svg.get_current_layer().add(inkex.Group(id="vlines-" + element.get('id')))
+                        if extrude is True:
+                            vlinesGroup = currentLayer.add(inkex.Group(id="vlines-" + elementId))
                             elemGroup.append(vlinesGroup)
                                                
                         if self.options.break_only is False:
+                            topElements, bottomElements, vlineElements = [], [], [] #added to the groups in one go
+                            horizontal_line_style = blackLineStyle
                             while i <= len(sub) - 1:
                                 stroke_color = '#000000'
-                                if self.options.colorize is True and self.options.break_apart is True:
+                                if colorize is True and breakApart is True: #only then the color changes from segment to segment
                                     stroke_color =colorSet[i-1]
+                                    horizontal_line_style = str(inkex.Style({'stroke':stroke_color,'stroke-width':strokeWidth,'fill':'none'}))
         
-                                horizontal_line_style = {'stroke':stroke_color,'stroke-width':self.svg.unittouu('1px'),'fill':'none'}
-        
-                                length = bezier.cspseglength(new[-1][-1], sub[i]) + to #sub path length
+                                length = lengths[i - 1] #sub path length
                                 #if length <= 0:
-                                #   inkex.utils.debug("Warning: path id={}, segment={} might overlap with previous and/or next segment. Maybe check for negative thickness offset.".format(element.get('id'), i))
-                                segment = "h {:0.6f} ".format(length)
-                                topPathData += segment
-                                bottomPathData += segment
-                                new[-1].append(sub[i]) #important line!
+                                #   inkex.utils.debug("Warning: path id={}, segment={} might overlap with previous and/or next segment. Maybe check for negative thickness offset.".format(elementId, i))
                                           
-                                mid_coord_x = xmin + sum([length for length in lengths]) + length/2
+                                mid_coord_x = xmin + unwoundLength + length/2
                                 font_size = 5
                                 font_y_offset = font_size + 1
                                 
-                                if self.options.number is True:
-                                    text = topLineGroup.add(TextElement(id=element.get('id') + "_TextNr{}".format(i)))
+                                if number is True:
+                                    text = TextElement(id=elementId + "_TextNr{}".format(i))
+                                    topElements.append(text)
                                     text.set("x", "{:0.6f}".format(mid_coord_x))
                                     text.set("y", "{:0.6f}".format(ymax - font_y_offset))
                                     text.set("font-size", "{:0.6f}".format(font_size))
                                     text.set("style", "text-anchor:middle;text-align:center;fill:{}".format(stroke_color))
                               
-                                    tspan = text.add(Tspan(id=element.get('id') + "_TSpanNr{}".format(i)))
+                                    tspan = text.add(Tspan(id=elementId + "_TSpanNr{}".format(i)))
                                     tspan.set("x", "{:0.6f}".format(mid_coord_x))
                                     if length <= 0:
                                         tspan.set("y", "{:0.6f}".format(ymax - font_y_offset - i))
@@ -197,69 +224,79 @@ class UnwindPaths(inkex.EffectExtension):
                                         tspan.set("y", "{:0.6f}".format(ymax - font_y_offset))        
                                     tspan.text = str(i)
                                 
-                                if self.options.break_apart is True:
-                                    self.drawline("m {:0.6f},{:0.6f} ".format(xmin + sum([length for length in lengths]), ymax) + segment, 
-                                                  "segmented-top-{}-{}".format(element.get('id'), i), topLineGroup, horizontal_line_style)
+                                if breakApart is True:
+                                    segment = "h {:0.6f}".format(length)
+                                    topElements.append(self.drawline("m {:0.6f},{:0.6f} {} ".format(xmin + unwoundLength, ymax, segment), 
+                                                  "segmented-top-{}-{}".format(elementId, i), horizontal_line_style))
                                     if length <= 0:
-                                        self.drawline("m {:0.6f},{:0.6f} ".format(mid_coord_x, ymax) + "v {} ".format(-5-i), 
-                                                      "segmented-top-overlap-{}-{}".format(element.get('id'), i), topLineGroup, horizontal_line_style)        
-                                    if self.options.extrude is True:
-                                        self.drawline("m {:0.6f},{:0.6f} ".format(xmin + sum([length for length in lengths]), ymax + shifting) + segment, 
-                                                      "segmented-bottom-{}-{}".format(element.get('id'), i), bottomLineGroup, horizontal_line_style) 
-                                lengths.append(length) 
+                                        topElements.append(self.drawline("m {:0.6f},{:0.6f} ".format(mid_coord_x, ymax) + "v {} ".format(-5-i), 
+                                                      "segmented-top-overlap-{}-{}".format(elementId, i), horizontal_line_style))
+                                    if extrude is True:
+                                        bottomElements.append(self.drawline("m {:0.6f},{:0.6f} {} ".format(xmin + unwoundLength, ymax + shifting, segment), 
+                                                      "segmented-bottom-{}-{}".format(elementId, i), horizontal_line_style))
+                                unwoundLength += length
                                 i += 1
                          
-                            if self.options.break_apart is False:  
-                                self.drawline(topPathData, "combined-top-{0}".format(element.get('id')), elemGroup, horizontal_line_style)
-                                if self.options.extrude is True:
-                                    self.drawline(bottomPathData, "combined-bottom-{0}".format(element.get('id')), elemGroup, horizontal_line_style)
+                            if breakApart is True:
+                                topLineGroup.extend(topElements)
+                                bottomLineGroup.extend(bottomElements)
+                            else:
+                                #horizontal segments, shared by top and bottom line. Built in one pass from the lengths
+                                segments = ["h {:0.6f}".format(length) for length in lengths]
+                                topPathData = " ".join(["m {:0.6f},{:0.6f}".format(xmin, ymax)] + segments) + " "
+                                bottomPathData = " ".join(["m {:0.6f},{:0.6f}".format(xmin, ymax + shifting)] + segments) + " "
+                                elemGroup.append(self.drawline(topPathData, "combined-top-{0}".format(elementId), horizontal_line_style))
+                                if extrude is True:
+                                    elemGroup.append(self.drawline(bottomPathData, "combined-bottom-{0}".format(elementId), horizontal_line_style))
+                                elemGroup.extend(topElements) #the number texts (there are no top line groups without breaking apart)
         
                             #draw as much vertical lines as segments in bezier + start + end vertical line
-                            vertical_end_lines_style = {'stroke':'#000000','stroke-width':self.svg.unittouu('1px'),'fill':'none'}
-                            if self.options.extrude is True:
+                            vertical_end_lines_style = blackLineStyle
+                            if extrude is True:
                                 #render start line
-                                self.drawline("m {:0.6f},{:0.6f} v {:0.6f}".format(xmin, ymax, shifting),"vline-{}-start".format(element.get('id')), vlinesGroup, vertical_end_lines_style)
+                                vlineElements.append(self.drawline("m {:0.6f},{:0.6f} v {:0.6f}".format(xmin, ymax, shifting),"vline-{}-start".format(elementId), vertical_end_lines_style))
                                 #render divider lines
                                 if self.options.render_vertical_dividers is True:
-                                    vertical_mid_lines_style = {'stroke':'#000000','stroke-width':self.svg.unittouu('1px'),'fill':'none'}
+                                    vertical_mid_lines_style = blackLineStyle
                                     if self.options.render_with_dashes is True:
-                                        vertical_mid_lines_style = {'stroke':'#000000','stroke-width':self.svg.unittouu('1px'),"stroke-dasharray":"2 2", 'fill':'none'}
+                                        vertical_mid_lines_style = str(inkex.Style({'stroke':'#000000','stroke-width':strokeWidth,"stroke-dasharray":"2 2", 'fill':'none'}))
                                     x = 0
                                     for n in range(0, i-2):           
                                         x += lengths[n]
-                                        self.drawline("m {:0.6f},{:0.6f} v {:0.6f}".format(xmin + x, ymax, shifting),"vline-{}-{}".format(element.get('id'), n + 1), vlinesGroup, vertical_mid_lines_style)
+                                        vlineElements.append(self.drawline("m {:0.6f},{:0.6f} v {:0.6f}".format(xmin + x, ymax, shifting),"vline-{}-{}".format(elementId, n + 1), vertical_mid_lines_style))
                                 #render end line
-                                self.drawline("m {:0.6f},{:0.6f} v {:0.6f}".format(xmin + sum([length for length in lengths]), ymax, shifting),"vline-{}-end".format(element.get('id')), vlinesGroup, vertical_end_lines_style)
+                                vlineElements.append(self.drawline("m {:0.6f},{:0.6f} v {:0.6f}".format(xmin + unwoundLength, ymax, shifting),"vline-{}-end".format(elementId), vertical_end_lines_style))
+                                vlinesGroup.extend(vlineElements)
     
-                    if self.options.break_apart is True:
+                    if breakApart is True:
                         # Split (already broken apart) paths into detached segments
-                        raw = Path(element.get("d")).to_arrays() #returns Uppercase Command Letters; does not include H, V
-                        for i in range(len(raw)):
-                            if i > 0:
-                                                 
-                                if raw[i-1][0] in ("M", "L"):
-                                    startPoint = "M {},{}".format(raw[i-1][1][0], raw[i-1][1][1])
-                                elif raw[i-1][0] == 'C':
-                                    startPoint = "M {},{}".format(raw[i-1][1][-2], raw[i-1][1][-1])
-                                else:
-                                    inkex.utils.debug("Start point error. Unknown command!")
-                                    
-                                if raw[i][0] in ("M", "L"):
-                                    segment = " {},{}".format(raw[i][1][0], raw[i][1][1])
-                                elif raw[i][0] == 'C':
-                                    segment = "{} {}".format(raw[i][0], ''.join(str(raw[i][1]))[1:-1])
-                                elif raw[i][0] == 'Z':
-                                    segment = "{},{}".format(raw[0][1][0], raw[0][1][1])
-                                else:
-                                    inkex.utils.debug("Segment error. Unknown command!")
-            
-                                d = str(Path("{} {}".format(startPoint, segment)))
-                       
-                                stroke_color = '#000000'
-                                if self.options.colorize is True:
-                                    stroke_color =colorSet[i-1]
-                                new_original_line_style = {'stroke':stroke_color,'stroke-width':self.svg.unittouu('1px'),'fill':'none'}
-                                self.drawline(d, "segmented-" + element.get('id'), newOriginalPathGroup, new_original_line_style)
+                        raw = path.to_arrays() #returns Uppercase Command Letters; does not include H, V
+                        newOriginalElements = [] #added to the group in one go
+                        for i in range(1, len(raw)):
+                            prevCommand, command = raw[i-1][0], raw[i][0]
+                            if prevCommand in ("M", "L"):
+                                startPoint = "M {},{}".format(raw[i-1][1][0], raw[i-1][1][1])
+                            elif prevCommand == 'C':
+                                startPoint = "M {},{}".format(raw[i-1][1][-2], raw[i-1][1][-1])
+                            else:
+                                inkex.utils.debug("Start point error. Unknown command!")
+                                
+                            if command in ("M", "L"):
+                                segment = " {},{}".format(raw[i][1][0], raw[i][1][1])
+                            elif command == 'C':
+                                segment = "{} {}".format(command, ''.join(str(raw[i][1]))[1:-1])
+                            elif command == 'Z':
+                                segment = "{},{}".format(raw[0][1][0], raw[0][1][1])
+                            else:
+                                inkex.utils.debug("Segment error. Unknown command!")
+        
+                            d = startPoint + " " + segment #already valid path data, no need to parse and format it again with Path()
+                   
+                            new_original_line_style = blackLineStyle
+                            if colorize is True:
+                                new_original_line_style = str(inkex.Style({'stroke':colorSet[i-1],'stroke-width':strokeWidth,'fill':'none'}))
+                            newOriginalElements.append(self.drawline(d, "segmented-" + elementId, new_original_line_style))
+                        newOriginalPathGroup.extend(newOriginalElements)
     
                     if self.options.keep_original is False:
                         element.delete()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+'''
+Compares fast_isect.isect_segments() with poly_point_isect.isect_segments() on T-junctions and on
+segments which only touch with their end points. Run with: python -m pytest tests
+'''
+
+import os
+import sys
+import random
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "extensions", "fablabchemnitz", "contour_scanner_and_trimmer"))
+pytest.importorskip("numba")
+import fast_isect
+import poly_point_isect
+
+
+def reference(segments):
+    ''' poly_point_isect trips over its own assertions for some degenerate inputs. We skip those samples '''
+    try:
+        return poly_point_isect.isect_segments(segments, validate=True)
+    except AssertionError:
+        return None
+
+
+def contains(points, point):
+    return any(abs(point[0] - p[0]) < 1e-6 and abs(point[1] - p[1]) < 1e-6 for p in points)
+
+
+def t_junctions(count, seed=0):
+    ''' random segment pairs where the second segment starts somewhere on the first one '''
+    rng = random.Random(seed)
+    for i in range(count):
+        a = (rng.uniform(0, 200), rng.uniform(0, 200))
+        b = (rng.uniform(0, 200), rng.uniform(0, 200))
+        t = rng.uniform(0.01, 0.99)
+        mid = (a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1]))
+        yield [(a, b), (mid, (rng.uniform(0, 200), rng.uniform(0, 200)))]
+
+
+def test_t_junction_example():
+    segments = [((10.0, 10.0), (180.0, 180.0)), ((30.0, 30.0), (40.0, 30.0))]
+    assert fast_isect.isect_segments(segments) == [(30.0, 30.0)]
+    assert fast_isect._seg_intersect.py_func(10.0, 10.0, 180.0, 180.0, 30.0, 30.0, 40.0, 30.0, True)[0] is True
+
+
+def test_t_junctions_match_reference():
+    compared = 0
+    for segments in t_junctions(2000):
+        expected = reference(segments)
+        if expected is None:
+            continue
+        compared += 1
+        found = fast_isect.isect_segments(segments)
+        for point in expected:
+            assert contains(found, point), segments
+    assert compared > 1000
+
+
+def test_t_junctions_in_sweep():
+    ''' enough segments to use the sweep line instead of testing all pairs '''
+    segments = [s for pair in t_junctions(fast_isect.SWEEP_THRESHOLD, seed=1) for s in pair]
+    bruteForce = fast_isect._all_intersections(fast_isect.np.array(segments).reshape(-1, 4), True)
+    found = fast_isect.isect_segments(segments)
+    assert len(found) >= fast_isect.SWEEP_THRESHOLD
+    assert set(found) == set(map(tuple, bruteForce.tolist())) #same kernel, so the points are identical
+
+
+@pytest.mark.parametrize("segments", [
+    [((0.0, 0.0), (10.0, 0.0)), ((10.0, 0.0), (10.0, 10.0))], #corner
+    [((0.0, 0.0), (10.0, 10.0)), ((10.0, 10.0), (20.0, 0.0))], #peak
+    [((0.0, 0.0), (10.0, 0.0)), ((10.0, 0.0), (20.0, 0.0))], #collinear continuation
+    [((0.0, 0.0), (10.0, 5.0)), ((10.0, 5.0), (3.0, 17.0)), ((3.0, 17.0), (0.0, 0.0))], #closed triangle
+])
+def test_endings_match_reference(segments):
+    expected = reference(segments)
+    assert expected is not None
+    assert fast_isect.isect_segments(segments) == expected == []